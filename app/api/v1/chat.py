@@ -4,30 +4,38 @@ Simplified in-memory version without conversation persistence.
 """
 
 import logging
-import json
-from typing import List, Dict, Any
+from typing import Dict, Any
 
-from app.services.chat_service import ChatService
-from app.schemas.chat import chat_request_from_dict, chat_response_dict
+import orjson
+
+from app.schemas.chat import chat_request_from_dict, chat_response_dict, preview_text
 
 logger = logging.getLogger(__name__)
 
-# Initialize chat service
-chat_service = ChatService()
+async def _parse_body(request) -> Dict[str, Any]:
+    """Read the request body once and decode it with orjson."""
+    body = await request.body()
+    return orjson.loads(body) if body else {}
+
+
+# Server-Sent Events must reach the client unbuffered. An explicit encoding
+# makes GZipMiddleware pass the stream through instead of compressing it.
+_SSE_HEADERS = {"Cache-Control": "no-cache", "Content-Encoding": "identity"}
+
 
 try:
     from fastapi import APIRouter, HTTPException, Request
-    from fastapi.responses import JSONResponse
+    from fastapi.responses import Response, StreamingResponse
     
     router = APIRouter()
 
     @router.post("/ask")
     async def ask_question(request: Request):
         """Ask a question about uploaded documents."""
+        chat_service = request.app.state.chat_service
         try:
             # Parse request body
-            body = await request.body()
-            data = json.loads(body) if body else {}
+            data = await _parse_body(request)
             
             # Create request object
             chat_request = chat_request_from_dict(data)
@@ -41,24 +49,46 @@ try:
                 document_ids=chat_request.document_ids
             )
             
-            return JSONResponse(content=chat_response_dict(response))
+            return Response(orjson.dumps(chat_response_dict(response)), media_type="application/json")
             
-        except json.JSONDecodeError:
+        except orjson.JSONDecodeError:
             raise HTTPException(status_code=400, detail="Invalid JSON in request body")
         except Exception as e:
-            logger.error(f"Error processing question: {e}")
+            logger.error("Error processing question: %s", e)
             raise HTTPException(
                 status_code=500,
                 detail="Error processing your question. Please try again."
             )
 
+    @router.post("/ask-stream")
+    async def ask_question_stream(request: Request):
+        """Ask a question and stream the answer back as Server-Sent Events."""
+        chat_service = request.app.state.chat_service
+        try:
+            data = await _parse_body(request)
+        except orjson.JSONDecodeError:
+            raise HTTPException(status_code=400, detail="Invalid JSON in request body")
+        
+        chat_request = chat_request_from_dict(data)
+        if not chat_request.question.strip():
+            raise HTTPException(status_code=400, detail="Question cannot be empty")
+        
+        async def event_stream():
+            async for event in chat_service.answer_question_stream(
+                question=chat_request.question,
+                document_ids=chat_request.document_ids
+            ):
+                yield b"data: " + orjson.dumps(event) + b"\n\n"
+        
+        return StreamingResponse(event_stream(), media_type="text/event-stream", headers=_SSE_HEADERS)
+
     @router.post("/debug-search")
     async def debug_search(request: Request):
         """Debug search functionality with detailed logging."""
+        chat_service = request.app.state.chat_service
         try:
             # Parse request body
-            body = await request.body()
-            data = json.loads(body) if body else {}
+            data = await _parse_body(request)
             
             query = data.get("question", "")
             if not query.strip():
@@ -70,46 +100,46 @@ try:
             # Perform search with debug info
             chunks = await chat_service.search_relevant_chunks(query)
             
+            # Build the payload in one pass and serialize it once
             debug_response = {
                 "query": query,
                 "available_documents": len(available_docs),
                 "total_chunks_found": len(chunks),
-                "chunks": []
+                "chunks": [
+                    {
+                        "chunk_id": chunk.get("id"),
+                        "document_id": chunk.get("document_id"),
+                        "score": chunk.get("score", 0),
+                        "content_preview": preview_text(chunk.get("content", ""), 300),
+                        "keywords": chunk.get("keywords", []),
+                        "chunk_index": chunk.get("chunk_index")
+                    }
+                    for chunk in chunks[:3]  # Show first 3 results
+                ],
+                # Also include document info
+                "documents": [
+                    {
+                        "id": doc.get("id"),
+                        "filename": doc.get("original_filename"),
+                        "chunks": doc.get("chunk_count", 0)
+                    }
+                    for doc in available_docs
+                ]
             }
             
-            for chunk in chunks[:3]:  # Show first 3 results
-                debug_response["chunks"].append({
-                    "chunk_id": chunk.get("id"),
-                    "document_id": chunk.get("document_id"),
-                    "score": chunk.get("score", 0),
-                    "content_preview": chunk.get("content", "")[:300] + "...",
-                    "keywords": chunk.get("keywords", []),
-                    "chunk_index": chunk.get("chunk_index")
-                })
-            
-            # Also include document info
-            debug_response["documents"] = [
-                {
-                    "id": doc.get("id"),
-                    "filename": doc.get("original_filename"),
-                    "chunks": doc.get("chunk_count", 0)
-                }
-                for doc in available_docs
-            ]
-            
-            return JSONResponse(content=debug_response)
+            return Response(orjson.dumps(debug_response), media_type="application/json")
             
         except Exception as e:
-            logger.error(f"Error in debug search: {e}")
-            return JSONResponse(content={"error": str(e), "traceback": str(e)})
+            logger.error("Error in debug search: %s", e)
+            return Response(orjson.dumps({"error": str(e), "traceback": str(e)}), media_type="application/json")
 
     @router.post("/search")
     async def search_documents(request: Request):
         """Search for relevant document chunks without generating an answer."""
+        chat_service = request.app.state.chat_service
         try:
             # Parse request body
-            body = await request.body()
-            data = json.loads(body) if body else {}
+            data = await _parse_body(request)
             
             # Create request object
             chat_request = chat_request_from_dict(data)
@@ -124,68 +154,73 @@ try:
             )
             
             # Format response
-            search_results = []
-            for chunk in chunks:
-                search_results.append({
+            search_results = [
+                {
                     "chunk_id": chunk.get("id"),
                     "document_id": chunk.get("document_id"),
-                    "content": chunk.get("content", "")[:500] + ("..." if len(chunk.get("content", "")) > 500 else ""),
+                    "content": preview_text(chunk.get("content", ""), 500),
                     "score": chunk.get("score", 0),
                     "keywords": chunk.get("keywords", [])
-                })
+                }
+                for chunk in chunks
+            ]
             
-            return JSONResponse(content=search_results)
+            return Response(orjson.dumps(search_results), media_type="application/json")
             
-        except json.JSONDecodeError:
+        except orjson.JSONDecodeError:
             raise HTTPException(status_code=400, detail="Invalid JSON in request body")
         except Exception as e:
-            logger.error(f"Error searching documents: {e}")
+            logger.error("Error searching documents: %s", e)
             raise HTTPException(
                 status_code=500,
                 detail="Error searching documents. Please try again."
             )
 
     @router.get("/debug")
-    async def debug_chat_service():
+    async def debug_chat_service(request: Request):
         """Debug endpoint to check document processing status."""
+        chat_service = request.app.state.chat_service
         try:
             available_docs = chat_service.get_available_documents()
             
-            debug_info = {
-                "total_documents": len(available_docs),
-                "groq_available": chat_service.is_groq_available(),
-                "documents": []
-            }
+            get_chunks = chat_service.doc_processor.get_document_chunks
             
-            for doc in available_docs:
-                doc_id = doc.get("id")
-                chunks = chat_service.doc_processor.get_document_chunks(doc_id)
-                
-                debug_info["documents"].append({
-                    "id": doc_id,
+            def document_info(doc: Dict[str, Any]) -> Dict[str, Any]:
+                chunks = get_chunks(doc.get("id"))
+                first = chunks[0] if chunks else None
+                return {
+                    "id": doc.get("id"),
                     "filename": doc.get("original_filename"),
                     "chunk_count": doc.get("chunk_count", 0),
                     "actual_chunks": len(chunks),
                     "file_size": doc.get("file_size", 0),
                     "status": doc.get("status"),
-                    "sample_chunk": chunks[0].get("content", "")[:200] + "..." if chunks else "No chunks",
-                    "sample_keywords": chunks[0].get("keywords", [])[:10] if chunks else []
-                })
+                    "sample_chunk": preview_text(first.get("content", ""), 200) if first else "No chunks",
+                    "sample_keywords": first.get("keywords", [])[:10] if first else []
+                }
+            
+            # Build the payload in one pass and serialize it once
+            debug_info = {
+                "total_documents": len(available_docs),
+                "groq_available": chat_service.is_groq_available(),
+                "documents": [document_info(doc) for doc in available_docs]
+            }
             
-            return JSONResponse(content=debug_info)
+            return Response(orjson.dumps(debug_info), media_type="application/json")
             
         except Exception as e:
-            logger.error(f"Error in debug endpoint: {e}")
-            return JSONResponse(content={"error": str(e)})
+            logger.error("Error in debug endpoint: %s", e)
+            return Response(orjson.dumps({"error": str(e)}), media_type="application/json")
 
     @router.get("/status")
-    async def get_chat_status():
+    async def get_chat_status(request: Request):
         """Get chat service status."""
+        chat_service = request.app.state.chat_service
         try:
             available_docs = chat_service.get_available_documents()
             groq_available = chat_service.is_groq_available()
             
-            return JSONResponse(content={
+            status_info = {
                 "status": "ready" if available_docs else "waiting_for_documents",
                 "groq_available": groq_available,
                 "available_documents": len(available_docs),
@@ -197,10 +232,12 @@ try:
                     }
                     for doc in available_docs
                 ]
-            })
+            }
+            
+            return Response(orjson.dumps(status_info), media_type="application/json")
             
         except Exception as e:
-            logger.error(f"Error getting chat status: {e}")
+            logger.error("Error getting chat status: %s", e)
             raise HTTPException(status_code=500, detail="Error getting chat status")
 
 except ImportError:
@@ -221,6 +258,9 @@ except ImportError:
     async def ask_question(**kwargs):
         return {"error": "FastAPI not available"}
     
+    async def ask_question_stream(**kwargs):
+        return {"error": "FastAPI not available"}
+    
     async def search_documents(**kwargs):
         return {"error": "FastAPI not available"}
     
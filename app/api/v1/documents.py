@@ -3,127 +3,176 @@ Document management endpoints for upload, processing, and retrieval.
 Simplified in-memory version without database persistence.
 """
 
+import asyncio
 import logging
 import os
-import json
+from itertools import islice
 from typing import List, Optional
 from uuid import uuid4
 
+import aiofiles
+import aiofiles.os
+import orjson
+
 from app.core.config import settings
-from app.services.document_processor import DocumentProcessor
 from app.schemas.document import document_response_dict, chunk_response_dict
 
 logger = logging.getLogger(__name__)
 
-# Initialize document processor
-doc_processor = DocumentProcessor()
+# Upload limits and location are fixed at startup
+MAX_FILE_SIZE = settings.MAX_FILE_SIZE
+UPLOAD_DIR = settings.UPLOAD_DIR
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # Read uploads 1 MiB at a time
+ALLOWED_EXTENSIONS = frozenset({'.pdf', '.docx', '.txt', '.md'})
+UPLOAD_BATCH_CONCURRENCY = 8  # Documents processed at once per batch upload
+os.makedirs(UPLOAD_DIR, exist_ok=True)
 
 try:
-    from fastapi import APIRouter, File, HTTPException, UploadFile
-    from fastapi.responses import JSONResponse
+    from fastapi import APIRouter, File, HTTPException, Query, Request, UploadFile
+    from fastapi.responses import Response
     
     router = APIRouter()
 
-    @router.post("/upload")
-    async def upload_document(file: UploadFile = File(...)):
-        """Upload and process a document."""
+    async def _save_upload(file: UploadFile) -> str:
+        """Validate an uploaded file and stream it into the upload directory."""
         # Validate file type
-        allowed_extensions = {'.pdf', '.docx', '.txt', '.md'}
-        file_extension = os.path.splitext(file.filename)[1].lower()
+        _, dot, extension = (file.filename or "").rpartition('.')
+        file_extension = f".{extension.lower()}" if dot else ""
         
-        if file_extension not in allowed_extensions:
+        if file_extension not in ALLOWED_EXTENSIONS:
             raise HTTPException(
                 status_code=400,
-                detail=f"Unsupported file type. Allowed: {', '.join(allowed_extensions)}"
+                detail=f"Unsupported file type. Allowed: {', '.join(sorted(ALLOWED_EXTENSIONS))}"
             )
         
-        # Check file size
-        content = await file.read()
-        if len(content) > getattr(settings, 'MAX_FILE_SIZE', 50 * 1024 * 1024):
+        # Generate unique filename
+        file_id = str(uuid4())
+        filename = f"{file_id}{file_extension}"
+        file_path = os.path.join(UPLOAD_DIR, filename)
+        
+        # Stream the upload to disk, stopping as soon as it exceeds the size limit
+        total_size = 0
+        async with aiofiles.open(file_path, "wb") as buffer:
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                total_size += len(chunk)
+                if total_size > MAX_FILE_SIZE:
+                    break
+                await buffer.write(chunk)
+        
+        if total_size > MAX_FILE_SIZE:
+            await aiofiles.os.remove(file_path)
             raise HTTPException(
                 status_code=413,
-                detail=f"File too large. Maximum size: {getattr(settings, 'MAX_FILE_SIZE', 50 * 1024 * 1024)} bytes"
+                detail=f"File too large. Maximum size: {MAX_FILE_SIZE} bytes"
             )
         
+        return file_path
+
+    @router.post("/upload")
+    async def upload_document(request: Request, file: UploadFile = File(...)):
+        """Upload and process a document."""
+        doc_processor = request.app.state.doc_processor
+        file_path = await _save_upload(file)
+        
         try:
-            # Generate unique filename
-            file_id = str(uuid4())
-            filename = f"{file_id}{file_extension}"
-            upload_dir = getattr(settings, 'UPLOAD_DIR', './uploads')
-            os.makedirs(upload_dir, exist_ok=True)
-            file_path = os.path.join(upload_dir, filename)
-            
-            # Save uploaded file
-            with open(file_path, "wb") as buffer:
-                buffer.write(content)
-            
             # Process document
             document = await doc_processor.process_document(
                 file_path=file_path,
                 original_filename=file.filename
             )
             
-            logger.info(f"Document uploaded and processed: {file.filename}")
+            logger.info("Document uploaded and processed: %s", file.filename)
             
-            return JSONResponse(content=document_response_dict(document))
+            return Response(orjson.dumps(document_response_dict(document)), media_type="application/json")
             
         except Exception as e:
-            logger.error(f"Error processing document {file.filename}: {e}")
+            logger.error("Error processing document %s: %s", file.filename, e)
             raise HTTPException(status_code=500, detail="Error processing document")
 
+    @router.post("/upload-batch")
+    async def upload_documents(request: Request, files: List[UploadFile] = File(...)):
+        """Upload and process several documents concurrently."""
+        doc_processor = request.app.state.doc_processor
+        semaphore = asyncio.Semaphore(UPLOAD_BATCH_CONCURRENCY)
+        
+        async def upload_one(file: UploadFile) -> dict:
+            async with semaphore:
+                try:
+                    file_path = await _save_upload(file)
+                    document = await doc_processor.process_document(
+                        file_path=file_path,
+                        original_filename=file.filename
+                    )
+                    logger.info("Document uploaded and processed: %s", file.filename)
+                    return document_response_dict(document)
+                except HTTPException as e:
+                    return {"original_filename": file.filename, "status": "failed", "error": e.detail}
+                except Exception as e:
+                    logger.error("Error processing document %s: %s", file.filename, e)
+                    return {"original_filename": file.filename, "status": "failed", "error": "Error processing document"}
+        
+        results = await asyncio.gather(*(upload_one(file) for file in files))
+        return Response(orjson.dumps(results), media_type="application/json")
+
     @router.get("/")
-    async def list_documents(skip: int = 0, limit: int = 100):
+    async def list_documents(request: Request, skip: int = Query(0, ge=0), limit: int = Query(100, ge=0)):
         """List all uploaded documents."""
+        doc_processor = request.app.state.doc_processor
         try:
-            documents = doc_processor.get_all_documents()
+            documents = doc_processor.iter_documents()
             # Apply pagination
-            paginated_docs = documents[skip:skip + limit]
-            return JSONResponse(content=[document_response_dict(doc) for doc in paginated_docs])
+            paginated_docs = islice(documents, skip, skip + limit)
+            payload = [document_response_dict(doc) for doc in paginated_docs]
+            return Response(orjson.dumps(payload), media_type="application/json")
             
         except Exception as e:
-            logger.error(f"Error fetching documents: {e}")
+            logger.error("Error fetching documents: %s", e)
             raise HTTPException(status_code=500, detail="Error fetching documents")
 
     @router.get("/{document_id}")
-    async def get_document(document_id: str):
+    async def get_document(request: Request, document_id: str):
         """Get details of a specific document."""
+        doc_processor = request.app.state.doc_processor
         try:
             document = doc_processor.get_document(document_id)
             if not document:
                 raise HTTPException(status_code=404, detail="Document not found")
-            return JSONResponse(content=document_response_dict(document))
+            return Response(orjson.dumps(document_response_dict(document)), media_type="application/json")
             
         except HTTPException:
             raise
         except Exception as e:
-            logger.error(f"Error fetching document {document_id}: {e}")
+            logger.error("Error fetching document %s: %s", document_id, e)
             raise HTTPException(status_code=500, detail="Error fetching document")
 
     @router.get("/{document_id}/chunks")
-    async def get_document_chunks(document_id: str):
+    async def get_document_chunks(request: Request, document_id: str):
         """Get all chunks for a specific document."""
+        doc_processor = request.app.state.doc_processor
         try:
             chunks = doc_processor.get_document_chunks(document_id)
-            return JSONResponse(content=[chunk_response_dict(chunk) for chunk in chunks])
+            payload = [chunk_response_dict(chunk) for chunk in chunks]
+            return Response(orjson.dumps(payload), media_type="application/json")
             
         except Exception as e:
-            logger.error(f"Error fetching chunks for document {document_id}: {e}")
+            logger.error("Error fetching chunks for document %s: %s", document_id, e)
             raise HTTPException(status_code=500, detail="Error fetching document chunks")
 
     @router.delete("/{document_id}")
-    async def delete_document(document_id: str):
+    async def delete_document(request: Request, document_id: str):
         """Delete a document and all its chunks."""
+        doc_processor = request.app.state.doc_processor
         try:
             success = doc_processor.delete_document(document_id)
             if not success:
                 raise HTTPException(status_code=404, detail="Document not found")
             
-            return JSONResponse(content={"message": "Document deleted successfully"})
+            return Response(orjson.dumps({"message": "Document deleted successfully"}), media_type="application/json")
             
         except HTTPException:
             raise
         except Exception as e:
-            logger.error(f"Error deleting document {document_id}: {e}")
+            logger.error("Error deleting document %s: %s", document_id, e)
             raise HTTPException(status_code=500, detail="Error deleting document")
 
 except ImportError:
@@ -149,6 +198,9 @@ except ImportError:
     async def upload_document(**kwargs):
         return {"error": "FastAPI not available"}
     
+    async def upload_documents(**kwargs):
+        return {"error": "FastAPI not available"}
+    
     async def list_documents(**kwargs):
         return {"error": "FastAPI not available"}
     
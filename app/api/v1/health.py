@@ -2,31 +2,38 @@
 Health check endpoints for monitoring system status.
 """
 
+import orjson
+
 try:
     from fastapi import APIRouter
+    from fastapi.responses import Response
     from app.core.config import settings
     
     router = APIRouter()
 
+    # Health payloads never change after startup, so serialize them once
+    _HEALTH = orjson.dumps({
+        "status": "healthy",
+        "service": "student-study-assistant",
+        "version": "1.0.0"
+    })
+    _DETAILED_HEALTH = orjson.dumps({
+        "status": "healthy",
+        "service": "student-study-assistant", 
+        "version": "1.0.0",
+        "mode": "in-memory",
+        "groq_api": "configured" if settings.GROQ_API_KEY else "not configured"
+    })
+
     @router.get("/")
     async def health_check():
         """Basic health check endpoint."""
-        return {
-            "status": "healthy",
-            "service": "student-study-assistant",
-            "version": "1.0.0"
-        }
+        return Response(_HEALTH, media_type="application/json")
 
     @router.get("/detailed")
     async def detailed_health_check():
         """Detailed health check with system information."""
-        return {
-            "status": "healthy",
-            "service": "student-study-assistant", 
-            "version": "1.0.0",
-            "mode": "in-memory",
-            "groq_api": "configured" if hasattr(settings, 'GROQ_API_KEY') and settings.GROQ_API_KEY else "not configured"
-        }
+        return Response(_DETAILED_HEALTH, media_type="application/json")
 
 except ImportError:
     # Fallback for development
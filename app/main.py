@@ -5,17 +5,22 @@ This is the main entry point for the Student Study Assistant application.
 It provides document processing, vector search, and AI-powered Q&A capabilities.
 """
 
+import asyncio
 import logging
 from contextlib import asynccontextmanager
 from pathlib import Path
 
+import orjson
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, ORJSONResponse, Response
 
 from app.core.config import settings
 from app.api.v1.router import api_router
+from app.services.chat_service import ChatService
+from app.services.document_processor import DocumentProcessor
 
 # Configure logging
 logging.basicConfig(
@@ -32,10 +37,21 @@ async def lifespan(app: FastAPI):
     logger.info("Starting Student Study Assistant...")
     logger.info("In-memory mode - no database persistence")
     
+    # Shared services used by all routers
+    app.state.doc_processor = DocumentProcessor()
+    app.state.chat_service = ChatService(doc_processor=app.state.doc_processor)
+    
+    # Load the embedding model while the Groq connection is being opened
+    async with asyncio.TaskGroup() as tg:
+        tg.create_task(app.state.doc_processor.warmup())
+        tg.create_task(app.state.chat_service.warmup())
+    
     yield
     
     # Shutdown
     logger.info("Shutting down Student Study Assistant...")
+    await app.state.chat_service.aclose()
+    await app.state.doc_processor.aclose()
 
 
 # Create FastAPI application
@@ -43,18 +59,22 @@ app = FastAPI(
     title="Student Study Assistant",
     description="AI-powered document processing and Q&A system for students",
     version="1.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],  # Configure appropriately for production
+    allow_origins=[settings.FRONTEND_ORIGIN],
     allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_methods=["GET", "POST", "DELETE"],
+    allow_headers=["Authorization", "Content-Type"],
 )
 
+# Compress large JSON payloads (document lists, chunks, search results)
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=5)
+
 # Include API router
 app.include_router(api_router, prefix="/api/v1")
 
@@ -79,10 +99,13 @@ async def root():
         }
 
 
+_HEALTH = orjson.dumps({"status": "healthy", "service": "student-study-assistant"})
+
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint."""
-    return {"status": "healthy", "service": "student-study-assistant"}
+    return Response(_HEALTH, media_type="application/json")
 
 
 if __name__ == "__main__":
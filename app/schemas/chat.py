@@ -2,6 +2,7 @@
 Chat-related data schemas.
 """
 
+from dataclasses import dataclass
 from typing import List, Optional, Dict, Any
 
 
@@ -18,13 +19,24 @@ class ChatRequest:
         self.document_ids = document_ids or []
 
 
+@dataclass(slots=True)
+class Source:
+    """One cited source of an answer; orjson serializes it like the equivalent dict."""
+    
+    document: str
+    page: str
+    chunk_id: str
+    relevance_score: float
+    preview: str
+
+
 class ChatResponse:
     """Response schema for chat operations."""
     
     def __init__(
         self,
         answer: str,
-        sources: List[Dict[str, Any]],
+        sources: List[Source],
         confidence: float = 0.0,
         chunks_used: int = 0,
         **kwargs
@@ -51,4 +63,9 @@ def chat_response_dict(response_data: Dict[str, Any]) -> Dict[str, Any]:
         "sources": response_data.get("sources", []),
         "confidence": response_data.get("confidence", 0.0),
         "chunks_used": response_data.get("chunks_used", 0)
-    }
\ No newline at end of file
+    }
+
+
+def preview_text(text: str, limit: int) -> str:
+    """Cut text to limit characters, marking it with "..." only when it was cut."""
+    return text if len(text) <= limit else text[:limit] + "..."
\ No newline at end of file
@@ -3,30 +3,147 @@ Chat service using Groq API for fast LLM inference.
 Provides context-aware Q&A without conversation history persistence.
 """
 
+import asyncio
 import logging
-from typing import List, Dict, Any, Optional
-import json
+import re
+import time
+from dataclasses import dataclass
+from typing import List, Dict, Any, AsyncIterator, Hashable, Optional, Tuple
+
+import numpy as np
 
 from app.core.config import settings
+from app.schemas.chat import Source, preview_text
 from app.services.document_processor import DocumentProcessor
+from app.services.response_cache import TTLCache
+from app.services.semantic_cache import SemanticCache
 
 logger = logging.getLogger(__name__)
 
+# Line kinds used when laying out LLM answers
+_LINE_TEXT = 0
+_LINE_HEADING = 1
+_LINE_NUMBERED = 2
+_LINE_BULLET = 3
+
+_RE_NUM_PREFIX = re.compile(r'\d+\.')
+
+# Replies to casual messages that don't need document search
+_CASUAL_RESPONSES = {
+    'thanks': "You're welcome! Feel free to ask me any other questions about your documents.",
+    'thank you': "You're very welcome! I'm here to help with any questions about your documents.",
+    'good': "Great! Let me know if you have any other questions about your documents.",
+    'ok': "Alright! Feel free to ask me anything else about your documents.",
+    'hello': "Hello! I'm ready to help you with questions about your uploaded documents.",
+    'hi': "Hi there! How can I help you analyze your documents today?"
+}
+_CASUAL_KEYS = frozenset(word + suffix for word in _CASUAL_RESPONSES for suffix in ('', '!', '.'))
+
+_NO_RESULTS_RESPONSE = {
+    "answer": "I couldn't find relevant information in your documents to answer that question. Please make sure your documents contain content related to your query.",
+    "sources": [],
+    "confidence": 0.0
+}
+
+GROQ_MODEL = "llama-3.1-8b-instant"  # Current supported production model
+GROQ_WARMUP_TIMEOUT = 5.0  # seconds
+GROQ_WARMUP_RETRY_INTERVAL = 60.0  # seconds between warm-up attempts after a failure
+
+# Static prompt text is built once; an identical system prompt on every
+# request also lets provider-side prompt caching reuse it
+_SYSTEM_MESSAGE = """You are a helpful AI assistant that answers questions based on provided document context. 
+
+Guidelines:
+- Answer questions accurately based only on the provided context
+- Use clean, well-formatted text without extra symbols like *** or **
+- Write clear, organized responses with proper paragraph breaks
+- Use bullet points with simple dashes (-) instead of asterisks
+- If the context doesn't contain relevant information, say so clearly
+- Be concise but comprehensive in your answers
+- Include specific details when available
+- For casual responses like "thanks", respond naturally without analyzing documents
+- If asked about something not in the context, explain what information is missing
+- Use a friendly, conversational tone suitable for students
+- Format your response clearly with proper spacing between sections"""
+
+_USER_MESSAGE_HEAD = "Here is the context from the user's documents:\n\n"
+_USER_MESSAGE_TAIL = """
+
+Please provide a clear, well-organized answer based on the context above. Use proper formatting with:
+- Clear paragraph breaks
+- Simple bullet points with dashes (-)  
+- No extra asterisks or special characters
+- Numbered lists where appropriate"""
+
+# Answers at least this long are post-processed in a worker thread
+POSTPROCESS_THREAD_MIN_CHARS = 1024
+
+
+def _estimate_tokens(text: str) -> int:
+    """Rough LLM token count (about four characters per token for English text)."""
+    return (len(text) + 3) // 4
+
+
+# Fixed "Document:/Content:/Keywords:" scaffolding around each context group
+_CONTEXT_HEADER_TOKENS = _estimate_tokens("Document: \nContent: \nKeywords: \n---\n\n")
+
+
+@dataclass(slots=True)
+class _Question:
+    """A question plus the normalized forms the answer pipeline needs, computed once."""
+    
+    raw: str
+    norm: str
+    tokens: Tuple[str, ...]
+    
+    @classmethod
+    def parse(cls, question: str) -> "_Question":
+        lowered = question.lower()
+        return cls(
+            raw=question,
+            norm=lowered.strip(),
+            tokens=tuple(word for word in lowered.split() if len(word) > 2)
+        )
+
 
 class ChatService:
     """Handles chat interactions using Groq API."""
     
-    def __init__(self):
-        self.doc_processor = DocumentProcessor()
+    def __init__(self, doc_processor: Optional[DocumentProcessor] = None):
+        self.doc_processor = doc_processor or DocumentProcessor()
         self.groq_client = None
+        self._groq_warm = False
+        self._warmup_task: Optional[asyncio.Task] = None
+        self._warmup_retry_at = 0.0
         self._init_groq_client()
+        
+        # Exact repeats of a question are answered without embedding it
+        self.response_cache = TTLCache(
+            maxsize=settings.RESPONSE_CACHE_MAX_ENTRIES,
+            ttl=settings.RESPONSE_CACHE_TTL
+        )
+        
+        # Near-duplicate questions are served from these caches (opt-in)
+        self.answer_cache: Optional[SemanticCache] = None
+        self.search_cache: Optional[SemanticCache] = None
+        if settings.ENABLE_SEMANTIC_CACHE:
+            self.answer_cache = SemanticCache(
+                threshold=settings.SEMANTIC_CACHE_THRESHOLD,
+                ttl=settings.SEMANTIC_CACHE_TTL,
+                max_entries=settings.SEMANTIC_CACHE_MAX_ENTRIES
+            )
+            self.search_cache = SemanticCache(
+                threshold=settings.SEMANTIC_CACHE_THRESHOLD,
+                ttl=settings.SEMANTIC_CACHE_TTL,
+                max_entries=settings.SEMANTIC_CACHE_MAX_ENTRIES
+            )
     
     def _init_groq_client(self):
         """Initialize Groq client if API key is available."""
         try:
             if hasattr(settings, 'GROQ_API_KEY') and settings.GROQ_API_KEY:
-                from groq import Groq
-                self.groq_client = Groq(api_key=settings.GROQ_API_KEY)
+                from groq import AsyncGroq
+                self.groq_client = AsyncGroq(api_key=settings.GROQ_API_KEY)
                 logger.info("Groq client initialized")
             else:
                 logger.warning("Groq API key not configured")
@@ -35,6 +152,28 @@ class ChatService:
         except Exception as e:
             logger.error(f"Error initializing Groq client: {e}")
     
+    async def warmup(self):
+        """Open the Groq connection pool ahead of the first question."""
+        if self.groq_client is None or self._groq_warm:
+            return
+        # Set first so concurrent callers don't each send a warm-up request
+        self._groq_warm = True
+        try:
+            # Cheap authenticated call that resolves DNS and completes the TLS handshake
+            await self.groq_client.with_options(timeout=GROQ_WARMUP_TIMEOUT).models.list()
+            logger.info("Groq connection warmed up")
+        except Exception as e:
+            self._groq_warm = False
+            self._warmup_retry_at = time.monotonic() + GROQ_WARMUP_RETRY_INTERVAL
+            logger.warning(f"Groq warm-up failed: {e}")
+    
+    async def aclose(self):
+        """Release the Groq client's HTTP connection pool."""
+        if self._warmup_task is not None:
+            self._warmup_task.cancel()
+        if self.groq_client is not None:
+            await self.groq_client.close()
+    
     async def answer_question(
         self, 
         question: str, 
@@ -44,52 +183,47 @@ class ChatService:
         """Generate an answer to a question using document context."""
         
         try:
+            q = _Question.parse(question)
+            
             # Handle casual conversation
-            casual_responses = {
-                'thanks': "You're welcome! Feel free to ask me any other questions about your documents.",
-                'thank you': "You're very welcome! I'm here to help with any questions about your documents.",
-                'good': "Great! Let me know if you have any other questions about your documents.",
-                'ok': "Alright! Feel free to ask me anything else about your documents.",
-                'hello': "Hello! I'm ready to help you with questions about your uploaded documents.",
-                'hi': "Hi there! How can I help you analyze your documents today?"
-            }
+            casual = self._casual_response(q)
+            if casual is not None:
+                return casual
+            
+            # Serve exact repeats, then near-duplicate questions, from cache
+            cache_namespace = self._cache_namespace(document_ids)
+            exact_key = (cache_namespace, q.norm)
+            cached = self.response_cache.get(exact_key)
+            if cached is not None:
+                logger.info("Answer served from exact-match cache")
+                return dict(cached)
             
-            question_lower = question.lower().strip()
-            for casual_word, response in casual_responses.items():
-                if question_lower in [casual_word, casual_word + '!', casual_word + '.']:
-                    return {
-                        "answer": response,
-                        "sources": [],
-                        "confidence": 1.0,
-                        "chunks_used": 0
-                    }
+            question_embedding = None
+            if self.answer_cache is not None:
+                question_embedding = await self._embed_question(question)
+            if question_embedding is not None:
+                cached = self.answer_cache.get(question_embedding, cache_namespace)
+                if cached is not None:
+                    logger.info("Answer served from semantic cache")
+                    return dict(cached)
             
             # Search for relevant chunks
-            relevant_chunks = await self.search_relevant_chunks(question, document_ids)
+            relevant_chunks = await self._search_warming_groq(q, document_ids, question_embedding)
             
             if not relevant_chunks:
-                return {
-                    "answer": "I couldn't find relevant information in your documents to answer that question. Please make sure your documents contain content related to your query.",
-                    "sources": [],
-                    "confidence": 0.0
-                }
+                return dict(_NO_RESULTS_RESPONSE)
             
             # Generate answer using Groq API
-            answer = await self._generate_answer(question, relevant_chunks)
+            answer, generated = await self._generate_answer(question, relevant_chunks)
+            result = await self._build_result(answer, relevant_chunks)
             
-            # Clean up formatting and improve structure
-            answer = self._clean_formatting(answer)
-            answer = self._format_response_structure(answer)
+            # Fallback answers are not cached, so the next ask retries the LLM
+            if generated:
+                self.response_cache.put(exact_key, result)
+                if question_embedding is not None and self.answer_cache is not None:
+                    self.answer_cache.put(question_embedding, cache_namespace, result)
             
-            # Format sources
-            sources = self._format_sources(relevant_chunks)
-            
-            return {
-                "answer": answer,
-                "sources": sources,
-                "confidence": min(len(relevant_chunks) / 3.0, 1.0),  # Simple confidence scoring
-                "chunks_used": len(relevant_chunks)
-            }
+            return dict(result)
             
         except Exception as e:
             logger.error(f"Error answering question: {e}")
@@ -100,122 +234,327 @@ class ChatService:
                 "error": str(e)
             }
     
+    async def answer_question_stream(
+        self,
+        question: str,
+        document_ids: Optional[List[str]] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Answer a question incrementally.
+        
+        Yields {"type": "token", "content": ...} events as the answer is
+        generated, then one {"type": "done", ...} event carrying the cleaned
+        answer in the same shape answer_question returns.
+        """
+        try:
+            q = _Question.parse(question)
+            casual = self._casual_response(q)
+            if casual is not None:
+                yield {"type": "done", **casual}
+                return
+            
+            cache_namespace = self._cache_namespace(document_ids)
+            exact_key = (cache_namespace, q.norm)
+            cached = self.response_cache.get(exact_key)
+            if cached is not None:
+                logger.info("Answer served from exact-match cache")
+                yield {"type": "done", **cached}
+                return
+            
+            question_embedding = None
+            if self.answer_cache is not None:
+                question_embedding = await self._embed_question(question)
+            if question_embedding is not None:
+                cached = self.answer_cache.get(question_embedding, cache_namespace)
+                if cached is not None:
+                    logger.info("Answer served from semantic cache")
+                    yield {"type": "done", **cached}
+                    return
+            
+            relevant_chunks = await self._search_warming_groq(q, document_ids, question_embedding)
+            if not relevant_chunks:
+                yield {"type": "done", **_NO_RESULTS_RESPONSE}
+                return
+            
+            # A stream that breaks off partway raises here and ends in an error event
+            parts = []
+            generated = True
+            async for token, generated in self._generate_answer_stream(question, relevant_chunks):
+                parts.append(token)
+                yield {"type": "token", "content": token}
+            
+            # Formatting needs the whole answer, so it runs once at the end
+            result = await self._build_result(''.join(parts).strip(), relevant_chunks)
+            if generated:
+                self.response_cache.put(exact_key, result)
+                if question_embedding is not None:
+                    self.answer_cache.put(question_embedding, cache_namespace, result)
+            yield {"type": "done", **result}
+            
+        except Exception as e:
+            logger.error(f"Error streaming answer: {e}")
+            yield {
+                "type": "error",
+                "answer": "I encountered an error while processing your question. Please try again.",
+                "error": str(e)
+            }
+    
+    def _casual_response(self, q: _Question) -> Optional[Dict[str, Any]]:
+        """Canned reply for casual messages like "thanks", or None."""
+        if q.norm not in _CASUAL_KEYS:
+            return None
+        return {
+            "answer": _CASUAL_RESPONSES[q.norm.rstrip('!.')],
+            "sources": [],
+            "confidence": 1.0,
+            "chunks_used": 0
+        }
+    
+    async def _build_result(self, answer: str, chunks: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Clean up a generated answer and attach its sources."""
+        # Clean up formatting and improve structure; long answers are
+        # formatted off the event loop, short ones aren't worth the thread hop
+        if len(answer) >= POSTPROCESS_THREAD_MIN_CHARS:
+            answer = await asyncio.to_thread(self._postprocess, answer)
+        else:
+            answer = self._postprocess(answer)
+        return {
+            "answer": answer,
+            "sources": self._format_sources(chunks),
+            "confidence": min(len(chunks) / 3.0, 1.0),  # Simple confidence scoring
+            "chunks_used": len(chunks)
+        }
+    
     async def search_relevant_chunks(
         self, 
         question: str, 
-        document_ids: Optional[List[str]] = None
+        document_ids: Optional[List[str]] = None,
+        question_embedding: Optional[np.ndarray] = None
     ) -> List[Dict[str, Any]]:
         """Search for relevant document chunks with fallback options."""
-        # First try regular search
-        results = self.doc_processor.search_chunks(question, document_ids)
+        return await self._search(_Question.parse(question), document_ids, question_embedding)
+    
+    async def _search_warming_groq(
+        self,
+        q: _Question,
+        document_ids: Optional[List[str]],
+        question_embedding: Optional[np.ndarray]
+    ) -> List[Dict[str, Any]]:
+        """Run _search, warming a cold Groq connection in the background meanwhile.
+        
+        The request never waits for the warm-up, and after a failed attempt
+        none is retried for GROQ_WARMUP_RETRY_INTERVAL seconds.
+        """
+        if (
+            self.groq_client is not None
+            and not self._groq_warm
+            and (self._warmup_task is None or self._warmup_task.done())
+            and time.monotonic() >= self._warmup_retry_at
+        ):
+            # Kept on self so the task is not garbage collected while running
+            self._warmup_task = asyncio.create_task(self.warmup())
+        return await self._search(q, document_ids, question_embedding)
+    
+    async def _search(
+        self,
+        q: _Question,
+        document_ids: Optional[List[str]],
+        question_embedding: Optional[np.ndarray]
+    ) -> List[Dict[str, Any]]:
+        """Cached keyword search, then embedding search, then keyword fallbacks."""
+        question = q.raw
+        cache_namespace = self._cache_namespace(document_ids)
+        if self.search_cache is not None:
+            if question_embedding is None:
+                question_embedding = await self._embed_question(question)
+            if question_embedding is not None:
+                cached = self.search_cache.get(question_embedding, cache_namespace)
+                if cached is not None:
+                    logger.info("Search results served from semantic cache")
+                    return list(cached)
         
+        # Searches are CPU-bound, so they run off the event loop
+        results = await asyncio.to_thread(self.doc_processor.search_chunks, question, document_ids)
+        
+        # No keyword match: one embedding lookup replaces the keyword probes
         if not results and question:
-            logger.info(f"No results for '{question}', trying fallback searches...")
-            
-            # Try with individual words from the question
-            question_words = [word.lower() for word in question.split() if len(word) > 2]
-            for word in question_words:
-                results = self.doc_processor.search_chunks(word, document_ids)
+            if question_embedding is None:
+                question_embedding = await self._embed_question(question)
+            if question_embedding is not None:
+                results = await asyncio.to_thread(
+                    self.doc_processor.semantic_search,
+                    question_embedding,
+                    document_ids,
+                    settings.MAX_SEARCH_RESULTS
+                )
+        
+        if not results and question:
+            results = await asyncio.to_thread(self._fallback_search, q, document_ids)
+        
+        if results and question_embedding is not None and self.search_cache is not None:
+            self.search_cache.put(question_embedding, cache_namespace, results)
+        
+        return list(results)
+    
+    def _fallback_search(self, q: _Question, document_ids: Optional[List[str]]) -> List[Dict[str, Any]]:
+        """Keyword fallbacks: single words, broad terms, then first chunks.
+        
+        The probes run one after another and stop at the first hit; threads would
+        not overlap them since the search is pure Python and holds the GIL.
+        """
+        logger.info(f"No results for '{q.raw}', trying fallback searches...")
+        results = []
+        
+        # Try with individual words from the question
+        for word in q.tokens:
+            results = self.doc_processor.search_chunks(word, document_ids)
+            if results:
+                logger.info(f"Found results using word '{word}'")
+                break
+        
+        # If still no results, try very broad searches
+        if not results:
+            broad_searches = ["summary", "main", "important", "key", "about", "topic"]
+            for search_term in broad_searches:
+                results = self.doc_processor.search_chunks(search_term, document_ids)
                 if results:
-                    logger.info(f"Found results using word '{word}'")
+                    logger.info(f"Found results using broad search '{search_term}'")
                     break
+        
+        # Last resort: return first few chunks of each document
+        if not results:
+            logger.info("No search matches found, returning first chunks from each document")
+            target_docs = document_ids if document_ids else [doc['id'] for doc in self.doc_processor.get_all_documents()]
             
-            # If still no results, try very broad searches
-            if not results:
-                broad_searches = ["summary", "main", "important", "key", "about", "topic"]
-                for search_term in broad_searches:
-                    results = self.doc_processor.search_chunks(search_term, document_ids)
-                    if results:
-                        logger.info(f"Found results using broad search '{search_term}'")
+            for doc_id in target_docs:
+                chunks = self.doc_processor.get_document_chunks(doc_id)
+                if chunks:
+                    # Add first few chunks with a default score
+                    for chunk in chunks[:3]:  # First 3 chunks
+                        chunk_with_score = chunk.copy()
+                        chunk_with_score['score'] = 1  # Low score to indicate fallback
+                        results.append(chunk_with_score)
+                    
+                    if len(results) >= 5:  # Limit total results
                         break
-            
-            # Last resort: return first few chunks of each document
-            if not results:
-                logger.info("No search matches found, returning first chunks from each document")
-                target_docs = document_ids if document_ids else list(self.doc_processor.get_all_documents())
-                
-                for doc_id in target_docs:
-                    chunks = self.doc_processor.get_document_chunks(doc_id)
-                    if chunks:
-                        # Add first few chunks with a default score
-                        for chunk in chunks[:3]:  # First 3 chunks
-                            chunk_with_score = chunk.copy()
-                            chunk_with_score['score'] = 1  # Low score to indicate fallback
-                            results.append(chunk_with_score)
-                        
-                        if len(results) >= 5:  # Limit total results
-                            break
         
         return results
     
-    async def _generate_answer(self, question: str, chunks: List[Dict[str, Any]]) -> str:
-        """Generate answer using Groq API."""
+    def _cache_namespace(self, document_ids: Optional[List[str]]) -> Hashable:
+        """Semantic cache namespace for a document selection and corpus version."""
+        return (self.doc_processor.version, tuple(sorted(document_ids or ())))
+    
+    async def _embed_question(self, question: str) -> Optional[np.ndarray]:
+        """Embed a question for cache lookups and semantic search; None if no embedder is available."""
+        vectors = await self._embed_many([question])
+        return None if vectors is None else vectors[0]
+    
+    async def _embed_many(self, texts: List[str]) -> Optional[np.ndarray]:
+        """Embed several texts in one model call; returns one normalized row per text."""
+        embedder = self.doc_processor.embedder
+        if embedder is None or not texts:
+            return None
+        
+        try:
+            vectors = await asyncio.to_thread(
+                embedder.encode, texts, batch_size=32, normalize_embeddings=True, convert_to_numpy=True
+            )
+            return np.asarray(vectors, dtype=np.float32)
+        except Exception as e:
+            logger.error(f"Error embedding {len(texts)} texts: {e}")
+            return None
+    
+    async def _generate_answer(self, question: str, chunks: List[Dict[str, Any]]) -> Tuple[str, bool]:
+        """Generate answer using Groq API.
+        
+        Returns the answer and whether the LLM produced it (False for the fallback answer).
+        """
         
         if not self.groq_client:
-            return self._generate_fallback_answer(question, chunks)
+            return self._generate_fallback_answer(question, chunks), False
         
         try:
-            # Prepare context from chunks
-            context = self._prepare_context(chunks)
-            
-            # Create system message
-            system_message = """You are a helpful AI assistant that answers questions based on provided document context. 
-
-Guidelines:
-- Answer questions accurately based only on the provided context
-- Use clean, well-formatted text without extra symbols like *** or **
-- Write clear, organized responses with proper paragraph breaks
-- Use bullet points with simple dashes (-) instead of asterisks
-- If the context doesn't contain relevant information, say so clearly
-- Be concise but comprehensive in your answers
-- Include specific details when available
-- For casual responses like "thanks", respond naturally without analyzing documents
-- If asked about something not in the context, explain what information is missing
-- Use a friendly, conversational tone suitable for students
-- Format your response clearly with proper spacing between sections"""
-
-            # Create user message with context and question
-            user_message = f"""Here is the context from the user's documents:
-
-{context}
-
-Question: {question}
-
-Please provide a clear, well-organized answer based on the context above. Use proper formatting with:
-- Clear paragraph breaks
-- Simple bullet points with dashes (-)  
-- No extra asterisks or special characters
-- Numbered lists where appropriate"""
-
             # Call Groq API
-            response = self.groq_client.chat.completions.create(
-                model="llama-3.1-8b-instant",  # Current supported production model
-                messages=[
-                    {"role": "system", "content": system_message},
-                    {"role": "user", "content": user_message}
-                ],
+            response = await self.groq_client.chat.completions.create(
+                model=GROQ_MODEL,
+                messages=self._build_messages(question, chunks),
                 max_tokens=500,
                 temperature=0.1,
                 top_p=0.9
             )
             
-            return response.choices[0].message.content.strip()
+            return response.choices[0].message.content.strip(), True
             
         except Exception as e:
             logger.error(f"Error calling Groq API: {e}")
-            return self._generate_fallback_answer(question, chunks)
+            return self._generate_fallback_answer(question, chunks), False
+    
+    async def _generate_answer_stream(
+        self,
+        question: str,
+        chunks: List[Dict[str, Any]]
+    ) -> AsyncIterator[Tuple[str, bool]]:
+        """Stream answer text from the Groq API as it is generated.
+        
+        Yields (text, generated) pairs; generated is False for the fallback
+        answer sent when Groq fails before producing any text. A failure after
+        text has been sent is re-raised, since the answer is then incomplete.
+        """
+        if not self.groq_client:
+            yield self._generate_fallback_answer(question, chunks), False
+            return
+        
+        streamed = False
+        try:
+            stream = await self.groq_client.chat.completions.create(
+                model=GROQ_MODEL,
+                messages=self._build_messages(question, chunks),
+                max_tokens=500,
+                temperature=0.1,
+                top_p=0.9,
+                stream=True
+            )
+            async for event in stream:
+                delta = event.choices[0].delta.content if event.choices else None
+                if delta:
+                    streamed = True
+                    yield delta, True
+        except Exception as e:
+            if streamed:
+                raise
+            logger.error(f"Error streaming from Groq API: {e}")
+            yield self._generate_fallback_answer(question, chunks), False
+    
+    def _build_messages(self, question: str, chunks: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+        """Build the Groq chat messages for a question and its context chunks."""
+        # Prepare context from chunks
+        context = self._prepare_context(chunks)
+        
+        return [
+            {"role": "system", "content": _SYSTEM_MESSAGE},
+            {"role": "user", "content": f"{_USER_MESSAGE_HEAD}{context}\n\nQuestion: {question}{_USER_MESSAGE_TAIL}"}
+        ]
     
     def _generate_fallback_answer(self, question: str, chunks: List[Dict[str, Any]]) -> str:
         """Generate a fallback answer when Groq API is unavailable."""
         if not chunks:
             return "I couldn't find relevant information in your documents to answer that question."
         
-        # Simple keyword-based response generation
-        context_text = " ".join([chunk['content'] for chunk in chunks[:3]])
+        # Simple keyword-based response generation: join the top chunks, but
+        # copy at most one character past the 800 kept so long chunks aren't joined whole
+        pieces = []
+        length = 0
+        for chunk in chunks[:3]:
+            if pieces:
+                pieces.append(" ")
+                length += 1
+            content = chunk['content'][:801 - length]
+            pieces.append(content)
+            length += len(content)
+            if length > 800:
+                break
         
         # Truncate context to reasonable length
-        if len(context_text) > 800:
-            context_text = context_text[:800] + "..."
+        context_text = preview_text("".join(pieces), 800)
         
         return f"""Based on your documents, here's the relevant information I found:
 
@@ -223,144 +562,157 @@ Please provide a clear, well-organized answer based on the context above. Use pr
 
 Note: Groq API is not available. For better AI-generated answers, please configure your GROQ_API_KEY in the .env file."""
     
-    def _clean_formatting(self, text: str) -> str:
-        """Clean up formatting issues in AI responses and improve readability."""
-        import re
-        
-        # Remove excessive asterisks and stars
-        text = re.sub(r'\*{2,}', '', text)  # Remove ** and more
-        text = re.sub(r'\*\s*\*', '', text)  # Remove * *
+    def _postprocess(self, answer: str) -> str:
+        """Clean up an AI answer and lay it out as paragraphs in a single pass.
         
-        # Clean up bullet points - replace * with -
-        text = re.sub(r'^\s*\*\s+', '- ', text, flags=re.MULTILINE)
-        text = re.sub(r'\n\s*\*\s+', '\n- ', text)
+        Each line is visited once: asterisks are dropped (a leading "* " becomes
+        a "- " bullet) and runs of whitespace are collapsed. Lines are grouped
+        into paragraphs that break after headings and around numbered items and
+        bullet sections. Short heading paragraphs are wrapped in ** for the
+        frontend to render bold, and bullet sections are indented slightly.
+        """
+        paragraphs: List[List[str]] = []
+        current: List[str] = []
+        prev_line = ''
+        prev_kind = _LINE_TEXT
         
-        # Fix spacing around colons
-        text = re.sub(r':\s*\*\s*', ': ', text)
-        
-        # Remove standalone asterisks
-        text = re.sub(r'\s+\*\s+', ' ', text)
-        text = re.sub(r'\*+', '', text)
-        
-        # Clean up multiple spaces
-        text = re.sub(r'\s{3,}', ' ', text)
-        
-        # Improve paragraph breaks and spacing
-        lines = text.split('\n')
-        formatted_lines = []
-        
-        for i, line in enumerate(lines):
-            line = line.strip()
+        for raw_line in answer.splitlines():
+            line = raw_line.strip()
+            is_star_bullet = line[:1] == '*' and line[1:2].isspace()
+            line = ' '.join(line.replace('*', '').split())
             if not line:
                 continue
-                
-            # Add extra spacing after headings (lines ending with :)
+            if is_star_bullet:
+                line = f"- {line}"
+            
+            numbered = _RE_NUM_PREFIX.match(line)
             if line.endswith(':') and not line.startswith('-'):
-                formatted_lines.append(line)
-                formatted_lines.append('')  # Add blank line after headings
+                kind = _LINE_HEADING
+            elif numbered:
+                kind = _LINE_NUMBERED
+            elif line.startswith('-'):
+                kind = _LINE_BULLET
+            else:
+                kind = _LINE_TEXT
             
-            # Add spacing before numbered items (1., 2., etc.)
-            elif re.match(r'^\d+\.', line) and i > 0:
-                if formatted_lines and formatted_lines[-1]:  # Don't add if already blank
-                    formatted_lines.append('')
-                formatted_lines.append(line)
+            # New paragraph before numbered items, before bullets that start a
+            # new section, and after a numbered item or bullet section ends
+            if kind == _LINE_NUMBERED:
+                needs_break = True
+            elif kind == _LINE_BULLET:
+                needs_break = bool(prev_line) and not prev_line.startswith('-') and not prev_line.endswith(':')
+            else:
+                needs_break = prev_kind in (_LINE_NUMBERED, _LINE_BULLET)
+            if needs_break and current:
+                paragraphs.append(current)
+                current = []
             
-            # Add spacing between bullet point sections
-            elif line.startswith('-') and i > 0:
-                prev_line = lines[i-1].strip() if i > 0 else ''
-                if prev_line and not prev_line.startswith('-') and not prev_line.endswith(':'):
-                    if formatted_lines and formatted_lines[-1]:
-                        formatted_lines.append('')
-                formatted_lines.append(line)
+            current.append(line)
+            if kind == _LINE_HEADING:
+                # Headings always stand alone
+                paragraphs.append(current)
+                current = []
             
-            # Regular lines
-            else:
-                formatted_lines.append(line)
-        
-        # Join with proper spacing
-        text = '\n'.join(formatted_lines)
+            # Only "1. text" style items force a break before the next line
+            if kind == _LINE_NUMBERED and line[numbered.end():numbered.end() + 1] != ' ':
+                kind = _LINE_TEXT
+            prev_line = line
+            prev_kind = kind
         
-        # Ensure proper spacing between sections
-        text = re.sub(r'\n{3,}', '\n\n', text)  # Max 2 consecutive newlines
+        if current:
+            paragraphs.append(current)
         
-        # Add spacing after numbered items that aren't followed by bullets
-        text = re.sub(r'(\d+\.\s[^\n]+)\n([^-\s])', r'\1\n\n\2', text)
-        
-        # Ensure bullet points have consistent spacing
-        text = re.sub(r'(\n-[^\n]+)\n([^-\s\n])', r'\1\n\n\2', text)
-        
-        return text.strip()
-        
-    def _format_response_structure(self, answer: str) -> str:
-        """Add proper structure and spacing to the response."""
-        # Split into paragraphs and format each section
-        paragraphs = answer.split('\n\n')
         formatted_paragraphs = []
-        
-        for para in paragraphs:
-            para = para.strip()
-            if not para:
-                continue
-                
-            # Check if this is a heading (ends with : and is relatively short)
-            if para.endswith(':') and len(para) <= 60 and '\n' not in para:
-                formatted_paragraphs.append(f"**{para}**")
+        for lines in paragraphs:
+            # Short single-line headings are shown bold
+            if len(lines) == 1 and lines[0].endswith(':') and len(lines[0]) <= 60:
+                formatted_paragraphs.append(f"**{lines[0]}**")
             
-            # Check if this contains bullet points
-            elif '-' in para and para.strip().startswith('-'):
-                lines = para.split('\n')
-                bullet_section = []
-                for line in lines:
-                    line = line.strip()
-                    if line.startswith('-'):
-                        bullet_section.append(f"  {line}")  # Indent bullets slightly
-                    else:
-                        bullet_section.append(line)
-                formatted_paragraphs.append('\n'.join(bullet_section))
+            # Indent bullets slightly
+            elif lines[0].startswith('-'):
+                formatted_paragraphs.append('\n'.join(f"  {line}" if line.startswith('-') else line for line in lines))
             
             # Regular paragraph
             else:
-                formatted_paragraphs.append(para)
+                formatted_paragraphs.append('\n'.join(lines))
         
         return '\n\n'.join(formatted_paragraphs)
 
     def _prepare_context(self, chunks: List[Dict[str, Any]]) -> str:
-        """Prepare context text from relevant chunks."""
+        """Prepare context text from relevant chunks, within the prompt token budget."""
         context_parts = []
+        documents = self._lookup_documents(chunks)
         
-        for i, chunk in enumerate(chunks[:5]):  # Use top 5 chunks
-            # Get document info
-            doc_info = self.doc_processor.get_document(chunk['document_id'])
-            doc_name = doc_info.get('original_filename', 'Unknown') if doc_info else 'Unknown'
+        # Take chunks in rank order while they fit the budget; one header per
+        # document, in order of its best-ranked chunk
+        budget = settings.CONTEXT_TOKEN_BUDGET
+        used = 0
+        groups: Dict[str, Tuple[str, List[str], Dict[str, None]]] = {}
+        for chunk in chunks:
+            doc_id = chunk['document_id']
+            group = groups.get(doc_id)
+            content = preview_text(chunk['content'], 800)
+            new_keywords = [
+                keyword for keyword in dict.fromkeys(chunk.get('keywords', []))
+                if group is None or keyword not in group[2]
+            ]
             
+            cost = _estimate_tokens(content) + _estimate_tokens(", ".join(new_keywords))
+            if group is None:
+                # Get document info
+                doc_info = documents[doc_id]
+                doc_name = doc_info.get('original_filename', 'Unknown') if doc_info else 'Unknown'
+                cost += _estimate_tokens(doc_name) + _CONTEXT_HEADER_TOKENS
+            if used + cost > budget:
+                continue
+            
+            used += cost
+            if group is None:
+                group = groups[doc_id] = (doc_name, [], {})
+            group[1].append(content)
+            group[2].update(dict.fromkeys(new_keywords))
+        
+        for doc_name, contents, keywords in groups.values():
+            content = "\n\n".join(contents)
             context_part = f"""Document: {doc_name}
-Content: {chunk['content'][:800]}{"..." if len(chunk['content']) > 800 else ""}
-Keywords: {", ".join(chunk.get('keywords', []))}
+Content: {content}
+Keywords: {", ".join(keywords)}
 ---"""
             
             context_parts.append(context_part)
         
         return "\n\n".join(context_parts)
     
-    def _format_sources(self, chunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    def _format_sources(self, chunks: List[Dict[str, Any]]) -> List[Source]:
         """Format source information from chunks."""
         sources = []
         seen_docs = set()
+        top_chunks = chunks[:3]  # Show top 3 sources
+        documents = self._lookup_documents(top_chunks)
         
-        for chunk in chunks[:3]:  # Show top 3 sources
-            doc_info = self.doc_processor.get_document(chunk['document_id'])
+        for chunk in top_chunks:
+            doc_info = documents[chunk['document_id']]
             if doc_info and chunk['document_id'] not in seen_docs:
-                sources.append({
-                    "document": doc_info.get('original_filename', 'Unknown'),
-                    "page": "N/A",  # Could be enhanced with page detection
-                    "chunk_id": chunk['id'],
-                    "relevance_score": chunk.get('score', 0),
-                    "preview": chunk['content'][:150] + "..." if len(chunk['content']) > 150 else chunk['content']
-                })
+                sources.append(Source(
+                    document=doc_info.get('original_filename', 'Unknown'),
+                    page="N/A",  # Could be enhanced with page detection
+                    chunk_id=chunk['id'],
+                    relevance_score=chunk.get('score', 0),
+                    preview=preview_text(chunk['content'], 150)
+                ))
                 seen_docs.add(chunk['document_id'])
         
         return sources
     
+    def _lookup_documents(self, chunks: List[Dict[str, Any]]) -> Dict[str, Optional[Dict[str, Any]]]:
+        """Fetch the document info of each distinct document among the chunks once."""
+        documents = {}
+        for chunk in chunks:
+            doc_id = chunk['document_id']
+            if doc_id not in documents:
+                documents[doc_id] = self.doc_processor.get_document(doc_id)
+        return documents
+    
     def get_available_documents(self) -> List[Dict[str, Any]]:
         """Get list of available documents for chat."""
         return self.doc_processor.get_all_documents()
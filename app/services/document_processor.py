@@ -3,18 +3,31 @@ In-memory document processing service with simple file-based persistence.
 Processes documents and saves them to JSON files for persistence across server restarts.
 """
 
+import asyncio
+import hashlib
+import heapq
+import mmap
 import os
-import json
 import logging
-from typing import List, Dict, Any
+import re
+import threading
+from typing import Callable, List, Dict, Any, Iterator, Optional, Set, Tuple
 from pathlib import Path
 import uuid
+from collections import Counter, OrderedDict
+from operator import itemgetter
+
+import numpy as np
+import orjson
+
+from app.core.config import settings
+from app.services.keyword_scoring import ChunkColumns, TrigramIndex
+from app.services.vector_index import ChunkVectorIndex
 
 logger = logging.getLogger(__name__)
 
-# In-memory storage for documents and chunks
+# In-memory storage for documents; chunks are read from disk on demand (see _LazyChunkStore)
 documents_store: Dict[str, Dict[str, Any]] = {}
-chunks_store: Dict[str, List[Dict[str, Any]]] = {}
 
 # Persistence directory
 PERSISTENCE_DIR = Path("data/documents")
@@ -26,12 +39,18 @@ def _ensure_persistence_dirs():
     PERSISTENCE_DIR.mkdir(parents=True, exist_ok=True)
     CHUNKS_DIR.mkdir(parents=True, exist_ok=True)
 
+def _write_json_atomic(path: Path, data: Any, option: int = 0):
+    """Write compact JSON to a temporary file and rename it over path in one step."""
+    tmp_path = path.with_suffix(path.suffix + '.tmp')
+    tmp_path.write_bytes(orjson.dumps(data, default=str, option=option))
+    # Readers see either the old file or the new one, never a partial write
+    os.replace(tmp_path, path)
+
 def _save_documents_index():
     """Save documents index to file."""
     try:
         _ensure_persistence_dirs()
-        with open(DOCUMENTS_FILE, 'w', encoding='utf-8') as f:
-            json.dump(documents_store, f, indent=2, default=str)
+        _write_json_atomic(DOCUMENTS_FILE, documents_store)
     except Exception as e:
         logger.error(f"Error saving documents index: {e}")
 
@@ -40,8 +59,8 @@ def _load_documents_index():
     global documents_store
     try:
         if DOCUMENTS_FILE.exists():
-            with open(DOCUMENTS_FILE, 'r', encoding='utf-8') as f:
-                documents_store = json.load(f)
+            with open(DOCUMENTS_FILE, 'rb') as f:
+                documents_store = orjson.loads(f.read())
                 logger.info(f"Loaded {len(documents_store)} documents from persistence")
     except Exception as e:
         logger.error(f"Error loading documents index: {e}")
@@ -51,9 +70,7 @@ def _save_document_chunks(doc_id: str, chunks: List[Dict[str, Any]]):
     """Save chunks for a document."""
     try:
         _ensure_persistence_dirs()
-        chunks_file = CHUNKS_DIR / f"{doc_id}.json"
-        with open(chunks_file, 'w', encoding='utf-8') as f:
-            json.dump(chunks, f, indent=2, default=str)
+        _write_json_atomic(CHUNKS_DIR / f"{doc_id}.json", chunks, orjson.OPT_SERIALIZE_NUMPY)
     except Exception as e:
         logger.error(f"Error saving chunks for {doc_id}: {e}")
 
@@ -62,25 +79,275 @@ def _load_document_chunks(doc_id: str) -> List[Dict[str, Any]]:
     try:
         chunks_file = CHUNKS_DIR / f"{doc_id}.json"
         if chunks_file.exists():
-            with open(chunks_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            with open(chunks_file, 'rb') as f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    return []
+                # Parse straight from the page cache instead of copying the file into a bytes object
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped, memoryview(mapped) as view:
+                    return orjson.loads(view)
     except Exception as e:
         logger.error(f"Error loading chunks for {doc_id}: {e}")
     return []
 
-def _load_all_chunks():
-    """Load all chunks into memory."""
-    global chunks_store
-    chunks_store = {}
-    for doc_id in documents_store.keys():
+# Documents whose parsed chunks stay in memory; others are re-read from disk when needed
+CHUNK_CACHE_DOCUMENTS = 128
+
+class _LazyChunkStore:
+    """Mapping of document id to chunks that reads a document's chunk file on first access.
+    
+    Parsed chunks are kept for the most recently used documents only.
+    """
+    
+    def __init__(self, max_loaded: int = CHUNK_CACHE_DOCUMENTS):
+        self.max_loaded = max_loaded
+        self._loaded: "OrderedDict[str, List[Dict[str, Any]]]" = OrderedDict()
+        # Search structures built from loaded chunks, keyed by document and builder
+        self._derived: Dict[str, Dict[Callable, Any]] = {}
+        self._lock = threading.Lock()
+    
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in documents_store
+    
+    def __len__(self) -> int:
+        return len(documents_store)
+    
+    def __getitem__(self, doc_id: str) -> List[Dict[str, Any]]:
+        if doc_id not in documents_store:
+            raise KeyError(doc_id)
+        with self._lock:
+            chunks = self._loaded.get(doc_id)
+            if chunks is not None:
+                self._loaded.move_to_end(doc_id)
+                return chunks
+        # Parsed outside the lock; a racing load of the same file is harmless
         chunks = _load_document_chunks(doc_id)
-        if chunks:
-            chunks_store[doc_id] = chunks
-    logger.info(f"Loaded chunks for {len(chunks_store)} documents")
+        with self._lock:
+            chunks = self._loaded.setdefault(doc_id, chunks)
+            self._evict()
+        return chunks
+    
+    def __setitem__(self, doc_id: str, chunks: List[Dict[str, Any]]):
+        with self._lock:
+            self._loaded[doc_id] = chunks
+            self._derived.pop(doc_id, None)
+            self._loaded.move_to_end(doc_id)
+            self._evict()
+    
+    def get(self, doc_id: str, default: Optional[List[Dict[str, Any]]] = None) -> Optional[List[Dict[str, Any]]]:
+        """Chunks of a document, or default if it is unknown."""
+        try:
+            return self[doc_id]
+        except KeyError:
+            return default
+    
+    def keys(self) -> List[str]:
+        """Ids of all stored documents, loaded or not."""
+        return list(documents_store)
+    
+    def derived(self, doc_id: str, build: Callable[[List[Dict[str, Any]]], Any]) -> Any:
+        """build(chunks) for a document, cached until its chunks are dropped."""
+        chunks = self[doc_id]
+        with self._lock:
+            value = self._derived.get(doc_id, {}).get(build)
+        if value is None:
+            value = build(chunks)
+            with self._lock:
+                if self._loaded.get(doc_id) is chunks:
+                    value = self._derived.setdefault(doc_id, {}).setdefault(build, value)
+        return value
+    
+    def discard(self, doc_id: str):
+        """Forget a document's loaded chunks, if any."""
+        with self._lock:
+            self._loaded.pop(doc_id, None)
+            self._derived.pop(doc_id, None)
+    
+    def clear(self):
+        """Forget all loaded chunks."""
+        with self._lock:
+            self._loaded.clear()
+            self._derived.clear()
+    
+    def _evict(self):
+        """Drop the least recently used documents beyond the limit; caller holds the lock."""
+        while len(self._loaded) > self.max_loaded:
+            evicted_id, _ = self._loaded.popitem(last=False)
+            self._derived.pop(evicted_id, None)
+
+chunks_store = _LazyChunkStore()
 
-# Load persisted data on module import
+# Load the persisted document index on module import; chunk files are read lazily
 _load_documents_index()
-_load_all_chunks()
+
+# Bumped whenever documents are added or removed so derived caches can tell stale entries apart
+_corpus_version = 0
+
+# Sentence embedding model, loaded on first use and shared by all processors
+_embedder = None
+_embedder_loaded = False
+_embedder_lock = threading.Lock()
+
+def _get_embedder():
+    """Load the embedding model once; returns None if it is unavailable."""
+    global _embedder, _embedder_loaded
+    if _embedder_loaded:
+        return _embedder
+    with _embedder_lock:
+        if not _embedder_loaded:
+            try:
+                from sentence_transformers import SentenceTransformer
+                _embedder = SentenceTransformer(settings.EMBEDDING_MODEL)
+                logger.info(f"Embedding model loaded: {settings.EMBEDDING_MODEL}")
+            except ImportError:
+                logger.warning("sentence-transformers not installed. Semantic features disabled.")
+            except Exception as e:
+                logger.error(f"Error loading embedding model: {e}")
+            _embedder_loaded = True
+    return _embedder
+
+# Text parsed from recently processed PDF/DOCX files, keyed by parser and content digest.
+# Uploads are saved under fresh names, so re-uploading a file is only recognisable by content.
+EXTRACT_CACHE_ENTRIES = 32
+_extract_cache: "OrderedDict[Tuple[Callable, bytes], str]" = OrderedDict()
+_extract_cache_lock = threading.Lock()
+
+def _cached_extraction(file_path: str, parse: Callable[[str], str]) -> str:
+    """Return parse(file_path), reusing the result for a file with identical contents."""
+    with open(file_path, 'rb') as f:
+        key = (parse, hashlib.file_digest(f, hashlib.blake2b).digest())
+    with _extract_cache_lock:
+        text = _extract_cache.get(key)
+        if text is not None:
+            _extract_cache.move_to_end(key)
+            return text
+    
+    text = parse(file_path)
+    with _extract_cache_lock:
+        _extract_cache[key] = text
+        while len(_extract_cache) > EXTRACT_CACHE_ENTRIES:
+            _extract_cache.popitem(last=False)
+    return text
+
+def _parse_pdf(file_path: str) -> str:
+    """Text of every page of a PDF, in page order."""
+    import fitz  # PyMuPDF
+    with fitz.open(file_path) as doc:
+        return "".join([page.get_text() for page in doc])
+
+def _parse_docx(file_path: str) -> str:
+    """Text of every paragraph of a DOCX file, one per line."""
+    from docx import Document
+    doc = Document(file_path)
+    return "".join([paragraph.text + "\n" for paragraph in doc.paragraphs])
+
+# Keyword extraction: words of two or more letters, minus common stop words
+_KEYWORD_RE = re.compile(r'\b[a-z]{2,}\b')
+_STOP_WORDS = frozenset({
+    'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for', 
+    'of', 'with', 'by', 'is', 'are', 'was', 'were', 'be', 'been', 'have', 
+    'has', 'had', 'do', 'does', 'did', 'will', 'would', 'could', 'should',
+    'this', 'that', 'these', 'those', 'i', 'you', 'he', 'she', 'it', 'we', 
+    'they', 'them', 'their', 'there', 'where', 'when', 'what', 'which', 'who', 'how',
+    'can', 'may', 'must', 'shall', 'also', 'just', 'only', 'even', 'still',
+    'now', 'then', 'here', 'very', 'more', 'most', 'much', 'many', 'some', 'any'
+})
+
+# Keyword search: related terms added for common question words, and queries
+# that give every otherwise unmatched chunk a base score
+_QUERY_EXPANSIONS = {
+    'summarize': ('summary', 'main', 'key', 'important', 'conclusion', 'overview'),
+    'summary': ('summarize', 'main', 'key', 'important', 'conclusion', 'overview'),
+    'what': ('about', 'topic', 'subject', 'main', 'content'),
+    'explain': ('about', 'description', 'definition', 'meaning'),
+    'describe': ('about', 'description', 'explanation', 'details'),
+    'overview': ('summary', 'main', 'introduction', 'about')
+}
+_BASE_SCORE_QUERIES = frozenset({'summarize', 'summary', 'what is this', 'main topic'})
+
+# Chunks scoring below this cosine similarity are not returned by semantic search
+SEMANTIC_MIN_SCORE = 0.30
+
+# Embedding index over all stored chunks, created once the vector size is known
+_vector_index: Optional[ChunkVectorIndex] = None
+_vector_index_lock = threading.Lock()
+
+# Documents are embedded in groups of about this many chunks, bounding each encode call
+INDEX_BATCH_CHUNKS = 512
+
+def _index_documents(doc_chunks: Dict[str, List[Dict[str, Any]]]):
+    """Embed the chunks of several documents and add them to the vector index.
+    
+    Documents are encoded in groups of up to INDEX_BATCH_CHUNKS chunks (a larger
+    document forms a group of its own), so memory per encode call stays bounded.
+    """
+    embedder = _get_embedder()
+    if embedder is None:
+        return
+    group: Dict[str, List[Dict[str, Any]]] = {}
+    group_chunks = 0
+    for doc_id, chunks in doc_chunks.items():
+        if not chunks or (_vector_index is not None and doc_id in _vector_index):
+            continue
+        if group and group_chunks + len(chunks) > INDEX_BATCH_CHUNKS:
+            _embed_group(embedder, group)
+            group, group_chunks = {}, 0
+        group[doc_id] = chunks
+        group_chunks += len(chunks)
+    if group:
+        _embed_group(embedder, group)
+
+def _embed_group(embedder, group: Dict[str, List[Dict[str, Any]]]):
+    """Embed a group of documents in one encode call and add them to the vector index."""
+    global _vector_index
+    try:
+        vectors = embedder.encode(
+            [chunk['content'] for chunks in group.values() for chunk in chunks],
+            batch_size=32,
+            normalize_embeddings=True,
+            convert_to_numpy=True
+        )
+    except Exception as e:
+        logger.error(f"Error embedding chunks for {len(group)} documents: {e}")
+        return
+    
+    with _vector_index_lock:
+        if _vector_index is None:
+            _vector_index = ChunkVectorIndex(dim=vectors.shape[1])
+    offset = 0
+    for doc_id, chunks in group.items():
+        # Skip documents deleted while their chunks were being embedded
+        if doc_id in documents_store:
+            _vector_index.add_document(doc_id, vectors[offset:offset + len(chunks)])
+        offset += len(chunks)
+
+def _index_persisted_documents(stop: threading.Event):
+    """Embed stored documents missing from the vector index, a group at a time, until stopped.
+    
+    Chunks are read through chunks_store, and only one group's worth is
+    collected at once, so memory stays bounded however large the corpus is.
+    """
+    if _get_embedder() is None:
+        return
+    indexed = 0
+    group: Dict[str, List[Dict[str, Any]]] = {}
+    group_chunks = 0
+    for doc_id in list(documents_store):
+        if stop.is_set():
+            return
+        if _vector_index is not None and doc_id in _vector_index:
+            continue
+        chunks = chunks_store.get(doc_id, [])
+        group[doc_id] = chunks
+        group_chunks += len(chunks)
+        if group_chunks >= INDEX_BATCH_CHUNKS:
+            _index_documents(group)
+            indexed += len(group)
+            group, group_chunks = {}, 0
+    if group and not stop.is_set():
+        _index_documents(group)
+        indexed += len(group)
+    if indexed:
+        logger.info(f"Indexed {indexed} stored documents for semantic search")
 
 
 class DocumentProcessor:
@@ -88,18 +355,53 @@ class DocumentProcessor:
     
     def __init__(self):
         self.supported_extensions = {'.pdf', '.docx', '.txt', '.md'}
+        # Embedding jobs running in worker threads; referenced here until they finish
+        self._index_tasks: Set[asyncio.Task] = set()
+        self._index_stop = threading.Event()
+    
+    async def warmup(self):
+        """Load the embedding model ahead of the first request.
+        
+        Stored documents are then embedded in the background; until a document
+        is indexed, semantic search leaves it out.
+        """
+        if await asyncio.to_thread(_get_embedder) is not None:
+            self._index_in_background(_index_persisted_documents, self._index_stop)
+    
+    async def aclose(self):
+        """Stop background indexing and wait for running embedding jobs."""
+        self._index_stop.set()
+        if self._index_tasks:
+            await asyncio.gather(*self._index_tasks, return_exceptions=True)
+    
+    def _index_in_background(self, func: Callable, *args):
+        """Run an indexing function in a worker thread without waiting for it."""
+        task = asyncio.create_task(asyncio.to_thread(func, *args))
+        self._index_tasks.add(task)
+        task.add_done_callback(self._index_tasks.discard)
+    
+    @property
+    def embedder(self):
+        """Shared sentence-transformers model, or None if unavailable."""
+        return _get_embedder()
+    
+    @property
+    def version(self) -> int:
+        """Counter that changes whenever the stored document set changes."""
+        return _corpus_version
     
     async def process_document(self, file_path: str, original_filename: str, **kwargs) -> Dict[str, Any]:
         """Process a document and create chunks."""
+        global _corpus_version
         try:
             # Generate document ID
             doc_id = str(uuid.uuid4())
             
-            # Extract text from document
-            text_content = await self._extract_text(file_path)
+            # Extract text from document (blocking file parsing runs in a worker thread)
+            text_content = await asyncio.to_thread(self._extract_text, file_path)
             
-            # Create chunks
-            chunks = await self._create_chunks(text_content, doc_id)
+            # Create chunks (keyword extraction is CPU-bound, so it also runs in a worker thread)
+            chunks = await asyncio.to_thread(self._create_chunks, text_content, doc_id)
             
             # Get file info
             file_stat = os.stat(file_path)
@@ -122,11 +424,17 @@ class DocumentProcessor:
             # Store in memory and persistence
             documents_store[doc_id] = document_info
             chunks_store[doc_id] = chunks
+            _corpus_version += 1
             
             # Save to persistence
             _save_documents_index()
             _save_document_chunks(doc_id, chunks)
             
+            # Embed the chunks for semantic search when a model is available; the
+            # upload returns without waiting, and keyword search covers the gap
+            if self.embedder is not None:
+                self._index_in_background(_index_documents, {doc_id: chunks})
+            
             logger.info(f"Processed document: {original_filename} ({len(chunks)} chunks) - SAVED TO PERSISTENCE")
             
             return document_info
@@ -135,39 +443,48 @@ class DocumentProcessor:
             logger.error(f"Error processing document {original_filename}: {e}")
             raise
     
-    async def _extract_text(self, file_path: str) -> str:
+    def _extract_text(self, file_path: str) -> str:
         """Extract text from various document formats."""
         file_extension = Path(file_path).suffix.lower()
         
         if file_extension == '.txt' or file_extension == '.md':
-            return await self._extract_text_file(file_path)
+            return self._extract_text_file(file_path)
         elif file_extension == '.pdf':
-            return await self._extract_pdf(file_path)
+            return self._extract_pdf(file_path)
         elif file_extension == '.docx':
-            return await self._extract_docx(file_path)
+            return self._extract_docx(file_path)
         else:
             raise ValueError(f"Unsupported file type: {file_extension}")
     
-    async def _extract_text_file(self, file_path: str) -> str:
+    def _extract_text_file(self, file_path: str) -> str:
         """Extract text from plain text files."""
-        try:
-            with open(file_path, 'r', encoding='utf-8') as file:
-                return file.read()
-        except UnicodeDecodeError:
-            # Try with different encoding
-            with open(file_path, 'r', encoding='latin-1') as file:
-                return file.read()
-    
-    async def _extract_pdf(self, file_path: str) -> str:
+        with open(file_path, 'rb') as file:
+            if os.fstat(file.fileno()).st_size < mmap.PAGESIZE:
+                # Mapping costs more than it saves for small files
+                data = file.read()
+            else:
+                # Decode straight from the mapped pages instead of a bytes copy
+                data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                try:
+                    text = str(data, 'utf-8')
+                except UnicodeDecodeError:
+                    # Try with different encoding
+                    text = str(data, 'latin-1')
+            finally:
+                if isinstance(data, mmap.mmap):
+                    data.close()
+        
+        # Match text-mode reads, which translate \r\n and \r line endings to \n
+        if '\r' in text:
+            text = text.replace('\r\n', '\n').replace('\r', '\n')
+        return text
+    
+    def _extract_pdf(self, file_path: str) -> str:
         """Extract text from PDF files."""
         try:
             import fitz  # PyMuPDF
-            doc = fitz.open(file_path)
-            text = ""
-            for page in doc:
-                text += page.get_text()
-            doc.close()
-            return text
+            return _cached_extraction(file_path, _parse_pdf)
         except ImportError:
             logger.warning("PyMuPDF not installed. PDF processing limited.")
             return f"PDF file: {os.path.basename(file_path)} (Text extraction requires PyMuPDF)"
@@ -175,15 +492,11 @@ class DocumentProcessor:
             logger.error(f"Error extracting PDF: {e}")
             return f"Error extracting PDF content: {str(e)}"
     
-    async def _extract_docx(self, file_path: str) -> str:
+    def _extract_docx(self, file_path: str) -> str:
         """Extract text from DOCX files."""
         try:
-            from docx import Document
-            doc = Document(file_path)
-            text = ""
-            for paragraph in doc.paragraphs:
-                text += paragraph.text + "\n"
-            return text
+            import docx  # python-docx
+            return _cached_extraction(file_path, _parse_docx)
         except ImportError:
             logger.warning("python-docx not installed. DOCX processing limited.")
             return f"DOCX file: {os.path.basename(file_path)} (Text extraction requires python-docx)"
@@ -191,7 +504,7 @@ class DocumentProcessor:
             logger.error(f"Error extracting DOCX: {e}")
             return f"Error extracting DOCX content: {str(e)}"
     
-    async def _create_chunks(self, text: str, doc_id: str, chunk_size: int = 1000, overlap: int = 200) -> List[Dict[str, Any]]:
+    def _create_chunks(self, text: str, doc_id: str, chunk_size: int = 1000, overlap: int = 200) -> List[Dict[str, Any]]:
         """Create text chunks from document content."""
         if not text.strip():
             return []
@@ -200,6 +513,7 @@ class DocumentProcessor:
         text_length = len(text)
         start = 0
         chunk_index = 0
+        id_prefix = f"{doc_id}_chunk_"
         
         while start < text_length:
             end = start + chunk_size
@@ -217,10 +531,10 @@ class DocumentProcessor:
             
             if chunk_text:
                 # Extract keywords (simple approach)
-                keywords = await self._extract_keywords(chunk_text)
+                keywords = self._extract_keywords(chunk_text)
                 
                 chunk = {
-                    "id": f"{doc_id}_chunk_{chunk_index}",
+                    "id": id_prefix + str(chunk_index),
                     "document_id": doc_id,
                     "content": chunk_text,
                     "chunk_index": chunk_index,
@@ -239,44 +553,22 @@ class DocumentProcessor:
         
         return chunks
     
-    async def _extract_keywords(self, text: str) -> List[str]:
+    def _extract_keywords(self, text: str) -> List[str]:
         """Extract keywords from text chunk."""
         # Simple keyword extraction - can be improved with NLP libraries
-        import re
-        
-        # Remove common stop words and extract meaningful terms
-        stop_words = {
-            'the', 'a', 'an', 'and', 'or', 'but', 'in', 'on', 'at', 'to', 'for', 
-            'of', 'with', 'by', 'is', 'are', 'was', 'were', 'be', 'been', 'have', 
-            'has', 'had', 'do', 'does', 'did', 'will', 'would', 'could', 'should',
-            'this', 'that', 'these', 'those', 'i', 'you', 'he', 'she', 'it', 'we', 
-            'they', 'them', 'their', 'there', 'where', 'when', 'what', 'which', 'who', 'how',
-            'can', 'may', 'must', 'shall', 'also', 'just', 'only', 'even', 'still',
-            'now', 'then', 'here', 'very', 'more', 'most', 'much', 'many', 'some', 'any'
-        }
-        
         # Extract words (letters only, minimum 2 characters for better matching)
-        words = re.findall(r'\b[a-zA-Z]{2,}\b', text.lower())
+        words = _KEYWORD_RE.findall(text.lower())
         
-        # Filter out stop words and get unique words
-        keywords = list(set(word for word in words if word not in stop_words))
-        
-        # Return top keywords (by frequency in this chunk)
-        word_freq = {}
-        for word in words:
-            if word not in stop_words:
-                word_freq[word] = word_freq.get(word, 0) + 1
-        
-        # Sort by frequency and return top 15 (more keywords for better matching)
-        sorted_keywords = sorted(word_freq.items(), key=lambda x: x[1], reverse=True)
-        return [word for word, freq in sorted_keywords[:15]]
+        # Count non-stop words and return the top 15 by frequency in this chunk
+        # (more keywords for better matching); ties keep first-seen order
+        word_freq = Counter(word for word in words if word not in _STOP_WORDS)
+        return [word for word, _ in word_freq.most_common(15)]
     
     def get_document(self, doc_id: str) -> Dict[str, Any]:
         """Get document info by ID."""
         # Ensure data is loaded
         if not documents_store and DOCUMENTS_FILE.exists():
             _load_documents_index()
-            _load_all_chunks()
         return documents_store.get(doc_id)
     
     def get_document_chunks(self, doc_id: str) -> List[Dict[str, Any]]:
@@ -284,7 +576,6 @@ class DocumentProcessor:
         # Ensure data is loaded
         if not chunks_store and DOCUMENTS_FILE.exists():
             _load_documents_index()
-            _load_all_chunks()
         return chunks_store.get(doc_id, [])
     
     def get_all_documents(self) -> List[Dict[str, Any]]:
@@ -292,15 +583,24 @@ class DocumentProcessor:
         # Ensure data is loaded
         if not documents_store and DOCUMENTS_FILE.exists():
             _load_documents_index()
-            _load_all_chunks()
         return list(documents_store.values())
     
+    def iter_documents(self) -> Iterator[Dict[str, Any]]:
+        """Iterate over all documents without building a list."""
+        # Ensure data is loaded
+        if not documents_store and DOCUMENTS_FILE.exists():
+            _load_documents_index()
+        return iter(documents_store.values())
+    
     def delete_document(self, doc_id: str) -> bool:
         """Delete a document and its chunks."""
+        global _corpus_version
         if doc_id in documents_store:
             del documents_store[doc_id]
-            if doc_id in chunks_store:
-                del chunks_store[doc_id]
+            chunks_store.discard(doc_id)
+            if _vector_index is not None:
+                _vector_index.remove_document(doc_id)
+            _corpus_version += 1
             
             # Remove from persistence
             try:
@@ -315,95 +615,140 @@ class DocumentProcessor:
             return True
         return False
     
+    def semantic_search(
+        self,
+        query_embedding: np.ndarray,
+        document_ids: List[str] = None,
+        limit: int = 5
+    ) -> List[Dict[str, Any]]:
+        """Find chunks whose embedding is close to a normalized query embedding."""
+        # Documents still being embedded in the background are not searched yet
+        if _vector_index is None:
+            return []
+        
+        results = []
+        for doc_id, position, score in _vector_index.search(query_embedding, limit, document_ids or None):
+            doc_chunks = chunks_store.get(doc_id)
+            if score < SEMANTIC_MIN_SCORE or not doc_chunks or position >= len(doc_chunks):
+                continue
+            chunk_with_score = doc_chunks[position].copy()
+            chunk_with_score['score'] = round(score, 4)
+            results.append(chunk_with_score)
+        
+        logger.info(f"Semantic search found {len(results)} chunks")
+        return results
+    
     def search_chunks(self, query: str, document_ids: List[str] = None) -> List[Dict[str, Any]]:
         """Simple text search in chunks."""
-        results = []
+        # (score, chunk) pairs; scored copies are only made for the returned chunks
+        results: List[Tuple[int, Dict[str, Any]]] = []
         query_lower = query.lower()
         
-        # Expand common search terms
-        query_expansions = {
-            'summarize': ['summary', 'main', 'key', 'important', 'conclusion', 'overview'],
-            'summary': ['summarize', 'main', 'key', 'important', 'conclusion', 'overview'],
-            'what': ['about', 'topic', 'subject', 'main', 'content'],
-            'explain': ['about', 'description', 'definition', 'meaning'],
-            'describe': ['about', 'description', 'explanation', 'details'],
-            'overview': ['summary', 'main', 'introduction', 'about']
-        }
-        
         # Build expanded query terms
-        expanded_terms = set(query_lower.split())
-        for word in query_lower.split():
-            if word in query_expansions:
-                expanded_terms.update(query_expansions[word])
+        query_words = query_lower.split()
+        expanded_terms = set(query_words)
+        for word in query_words:
+            expansion = _QUERY_EXPANSIONS.get(word)
+            if expansion is not None:
+                expanded_terms.update(expansion)
         
         # Get all relevant chunks
         target_docs = document_ids if document_ids else list(chunks_store.keys())
         
         logger.info(f"Searching for: '{query}' (expanded: {list(expanded_terms)}) across {len(target_docs)} documents")
-        logger.info(f"Total chunks available: {sum(len(chunks_store.get(doc_id, [])) for doc_id in target_docs)}")
+        
+        # Per-chunk debug messages are only built when debug logging is on
+        debug = logger.isEnabledFor(logging.DEBUG)
+        chunk_count = 0
+        
+        # Only chunks containing some term can score, unless the common-query base
+        # score applies; a query that matches is made of terms, so it is covered too
+        terms = list(expanded_terms)
+        use_index = bool(terms) and query_lower not in _BASE_SCORE_QUERIES
+        term_lengths = [(term, len(term) > 3) for term in terms]
         
         for doc_id in target_docs:
-            if doc_id in chunks_store:
-                doc_chunks = chunks_store[doc_id]
-                logger.info(f"Document {doc_id[:8]}... has {len(doc_chunks)} chunks")
+            # Deletes run on the event loop while searches run in worker threads, so a
+            # document can vanish mid-search; it is then skipped rather than failing the query
+            doc_chunks = chunks_store.get(doc_id)
+            if doc_chunks is not None:
+                chunk_count += len(doc_chunks)
                 
-                for chunk in doc_chunks:
+                candidates = None
+                try:
+                    if use_index and doc_chunks:
+                        index = chunks_store.derived(doc_id, TrigramIndex.from_chunks)
+                        candidates = index.candidates(terms)
+                        if candidates == 0:
+                            continue
+                    
+                    # Score from per-document columns; result dicts are only built for matches
+                    columns = chunks_store.derived(doc_id, ChunkColumns.from_chunks)
+                except (KeyError, OSError):
+                    continue
+                ids, contents_lower, keyword_sets = columns.ids, columns.contents_lower, columns.keyword_sets
+                positions = index.positions(candidates) if candidates is not None else range(len(columns))
+                
+                for i in positions:
                     # Simple scoring based on keyword matches and content relevance
                     score = 0
-                    chunk_content = chunk['content'].lower()
+                    chunk_content = contents_lower[i]
                     
                     # Check for direct text matches with original query
                     if query_lower in chunk_content:
                         score += 5
-                        logger.debug(f"Direct match found in chunk {chunk['id']} (score +5)")
+                        if debug:
+                            logger.debug(f"Direct match found in chunk {ids[i]} (score +5)")
                     
-                    # Check for expanded term matches in content
-                    for term in expanded_terms:
+                    # One pass over the expanded terms: +3 in content, +2 as a keyword,
+                    # and for longer words (over 3 characters) another +1 each for
+                    # appearing in content and in some keyword; an exact keyword
+                    # always counts as contained in a keyword too
+                    chunk_keywords = keyword_sets[i]
+                    for term, is_long in term_lengths:
                         if term in chunk_content:
-                            score += 3
-                            logger.debug(f"Expanded term '{term}' found in content (score +3)")
-                    
-                    # Check for keyword matches
-                    query_words = expanded_terms
-                    chunk_keywords = set(chunk.get('keywords', []))
-                    common_keywords = query_words.intersection(chunk_keywords)
-                    score += len(common_keywords) * 2
-                    if common_keywords:
-                        logger.debug(f"Keyword matches in chunk {chunk['id']}: {common_keywords} (score +{len(common_keywords) * 2})")
-                    
-                    # Check for partial word matches
-                    for word in query_words:
-                        if len(word) > 3:  # Only check longer words
-                            if any(word in keyword for keyword in chunk_keywords):
-                                score += 1
-                            # Also check if query word appears in content
-                            if word in chunk_content:
-                                score += 1
+                            points = 4 if is_long else 3
+                            score += points
+                            if debug:
+                                logger.debug(f"Expanded term '{term}' found in content (score +{points})")
+                        if term in chunk_keywords:
+                            points = 3 if is_long else 2
+                            score += points
+                            if debug:
+                                logger.debug(f"Keyword match in chunk {ids[i]}: {term} (score +{points})")
+                        elif is_long and any(term in keyword for keyword in chunk_keywords):
+                            score += 1
                     
                     # If no score yet but this is a common query, give it a base score
-                    if score == 0 and query_lower in ['summarize', 'summary', 'what is this', 'main topic']:
+                    if score == 0 and query_lower in _BASE_SCORE_QUERIES:
                         score = 2  # Base score for common queries
-                        logger.debug(f"Applied base score for common query: {query_lower}")
+                        if debug:
+                            logger.debug(f"Applied base score for common query: {query_lower}")
                     
                     if score > 0:
-                        chunk_with_score = chunk.copy()
-                        chunk_with_score['score'] = score
-                        results.append(chunk_with_score)
-                        logger.debug(f"Added chunk {chunk['id']} with score {score}")
+                        results.append((score, doc_chunks[i]))
+                        if debug:
+                            logger.debug(f"Added chunk {ids[i]} with score {score}")
+        
+        logger.info(f"Total chunks available: {chunk_count}")
         
-        # Sort by score and return top results
-        results.sort(key=lambda x: x['score'], reverse=True)
+        # Keep the top 5 results by score (ties in search order) without sorting the rest
+        top_results = [
+            {**chunk, 'score': score}
+            for score, chunk in heapq.nlargest(5, results, key=itemgetter(0))
+        ]
         logger.info(f"Search completed: found {len(results)} relevant chunks")
         
-        if results:
-            logger.info(f"Top result score: {results[0]['score']}")
+        if top_results:
+            logger.info(f"Top result score: {top_results[0]['score']}")
         else:
             logger.warning(f"No relevant chunks found for query: '{query}'")
             # Debug: show what we have
             for doc_id in target_docs[:1]:  # Just check first doc
-                if doc_id in chunks_store and chunks_store[doc_id]:
-                    sample_chunk = chunks_store[doc_id][0]
+                sample_chunks = chunks_store.get(doc_id) if debug else None
+                if sample_chunks:
+                    sample_chunk = sample_chunks[0]
                     logger.debug(f"Sample chunk content (first 200 chars): {sample_chunk['content'][:200]}")
                     logger.debug(f"Sample chunk keywords: {sample_chunk.get('keywords', [])[:10]}")
         
-        return results[:5]  # Return top 5 results
\ No newline at end of file
+        return top_results
\ No newline at end of file
@@ -0,0 +1,84 @@
+"""
+Per-document search structures for keyword search.
+
+TrigramIndex narrows a search to the chunks that can match at all: a chunk
+only contains a term of three or more characters if it contains every
+trigram of that term. ChunkColumns holds the fields the scoring loop reads as
+parallel lists, already lowercased and turned into sets, so the loop indexes
+lists instead of chunk dicts and repeats no per-chunk preparation.
+"""
+
+import logging
+from dataclasses import dataclass
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(slots=True)
+class ChunkColumns:
+    """The searched fields of a document's chunks as parallel lists."""
+
+    ids: List[str]
+    contents_lower: List[str]
+    keyword_sets: List[FrozenSet[str]]
+
+    @classmethod
+    def from_chunks(cls, chunks: List[Dict[str, Any]]) -> "ChunkColumns":
+        """Split chunk dicts into columns, lowercasing content once."""
+        return cls(
+            ids=[chunk['id'] for chunk in chunks],
+            contents_lower=[chunk['content'].lower() for chunk in chunks],
+            keyword_sets=[frozenset(chunk.get('keywords', [])) for chunk in chunks]
+        )
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+
+@dataclass(slots=True)
+class TrigramIndex:
+    """Trigrams of a document's lowercased chunk contents and keywords, as chunk bitmasks."""
+
+    postings: Dict[str, int]
+    size: int
+
+    @classmethod
+    def from_chunks(cls, chunks: List[Dict[str, Any]]) -> "TrigramIndex":
+        """Index chunk dicts; bit i of a posting is set when chunk i has the trigram."""
+        positions: Dict[str, List[int]] = {}
+        for i, chunk in enumerate(chunks):
+            texts = [chunk['content'].lower(), *chunk.get('keywords', [])]
+            grams = {text[j:j + 3] for text in texts for j in range(len(text) - 2)}
+            for gram in grams:
+                positions.setdefault(gram, []).append(i)
+
+        nbytes = (len(chunks) + 7) // 8 or 1
+        postings = {}
+        for gram, members in positions.items():
+            bits = np.zeros(nbytes * 8, dtype=bool)
+            bits[members] = True
+            postings[gram] = int.from_bytes(np.packbits(bits, bitorder="little").tobytes(), "little")
+        return cls(postings, len(chunks))
+
+    def candidates(self, terms: Iterable[str]) -> Optional[int]:
+        """Bitmask of chunks that may contain any of the terms, or None if every chunk may."""
+        mask = 0
+        for term in terms:
+            if len(term) < 3:
+                return None
+            term_mask = -1
+            for j in range(len(term) - 2):
+                term_mask &= self.postings.get(term[j:j + 3], 0)
+                if not term_mask:
+                    break
+            mask |= term_mask
+        return mask
+
+    def positions(self, mask: int) -> List[int]:
+        """Chunk positions set in a candidates() bitmask, in ascending order."""
+        nbytes = (self.size + 7) // 8 or 1
+        bits = np.unpackbits(np.frombuffer(mask.to_bytes(nbytes, "little"), dtype=np.uint8), bitorder="little")
+        return np.flatnonzero(bits[:self.size]).tolist()
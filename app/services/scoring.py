@@ -0,0 +1,29 @@
+"""
+Vector scoring helpers for semantic search.
+
+Vectors are expected to be L2-normalized, so a dot product is the cosine
+similarity. Scores come from numpy's matrix-vector product, which BLAS already
+spreads across cores and which is safe to call from several threads at once.
+"""
+
+import logging
+from typing import Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def topk_cosine(query: np.ndarray, matrix: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Return the indices and scores of the k rows most similar to query, best first."""
+    rows = matrix.shape[0]
+    if rows == 0 or k <= 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+    scores = np.asarray(matrix, dtype=np.float32) @ np.asarray(query, dtype=np.float32)
+    if k < rows:
+        top = np.argpartition(-scores, k - 1)[:k]
+    else:
+        top = np.arange(rows)
+    order = top[np.argsort(-scores[top], kind="stable")]
+    return order, scores[order]
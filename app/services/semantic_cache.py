@@ -0,0 +1,175 @@
+"""
+Semantic cache for question-level results.
+
+Entries are keyed by an L2-normalized question embedding plus a namespace
+(the searched document set). A lookup returns the value of the most similar
+unexpired entry in the same namespace once its cosine similarity reaches the
+configured threshold, so near-duplicate questions skip retrieval and generation.
+
+Small caches are scanned exactly. Larger ones use random-projection LSH: each
+of NUM_TABLES tables buckets entries by the sign pattern of NUM_BITS random
+projections, and only the entries sharing a bucket with the query are rescored.
+"""
+
+import logging
+import time
+from typing import Any, Dict, Hashable, List, Optional, Set, Tuple
+
+import numpy as np
+
+from app.services.scoring import topk_cosine
+
+logger = logging.getLogger(__name__)
+
+# Random-projection LSH parameters
+NUM_TABLES = 10
+NUM_BITS = 16
+
+# Below this many entries an exact scan is cheaper than hashing
+EXACT_SCAN_LIMIT = 1024
+
+# A put this similar to a live entry replaces it instead of taking a new slot
+DEDUPE_THRESHOLD = 0.95
+
+
+class SemanticCache:
+    """Fixed-capacity embedding cache with TTL expiry and oldest-first eviction."""
+
+    def __init__(self, threshold: float, ttl: float, max_entries: int):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+        # Ring buffer of entries; the vector matrix is allocated on first put
+        # once the embedding dimension is known.
+        self._vectors: Optional[np.ndarray] = None
+        self._namespace_ids = np.full(max_entries, -1, dtype=np.int64)
+        self._expires_at = np.zeros(max_entries, dtype=np.float64)
+        self._values: List[Any] = [None] * max_entries
+        self._namespaces: Dict[Hashable, int] = {}
+        self._next_namespace_id = 0
+        self._size = 0
+        self._next_slot = 0
+
+        # LSH tables map (namespace id, bucket signature) to the slots stored there
+        self._projections: Optional[np.ndarray] = None
+        self._tables: List[Dict[Tuple[int, bytes], Set[int]]] = [{} for _ in range(NUM_TABLES)]
+        self._slot_buckets: List[Optional[List[bytes]]] = [None] * max_entries
+
+    def get(self, embedding: np.ndarray, namespace: Hashable) -> Optional[Any]:
+        """Return the cached value for a similar question, or None on a miss."""
+        namespace_id = self._namespaces.get(namespace)
+        if namespace_id is None or self._vectors is None:
+            return None
+
+        match = self._best_match(embedding, namespace_id)
+        if match is None or match[1] < self.threshold:
+            return None
+
+        logger.debug(f"Semantic cache hit (similarity {match[1]:.3f})")
+        return self._values[match[0]]
+
+    def put(self, embedding: np.ndarray, namespace: Hashable, value: Any):
+        """Store a value, evicting the oldest entry once the cache is full.
+
+        A near-duplicate of a live entry in the same namespace overwrites it.
+        """
+        vector = np.asarray(embedding, dtype=np.float32)
+        if self._vectors is None:
+            dim = vector.shape[0]
+            self._vectors = np.zeros((self.max_entries, dim), dtype=np.float32)
+            rng = np.random.default_rng(0)
+            self._projections = rng.standard_normal((NUM_TABLES, NUM_BITS, dim)).astype(np.float32)
+
+        namespace_id = self._namespaces.get(namespace)
+        if namespace_id is None:
+            if len(self._namespaces) >= self.max_entries:
+                self._drop_unused_namespaces()
+            namespace_id = self._next_namespace_id
+            self._namespaces[namespace] = namespace_id
+            self._next_namespace_id += 1
+
+        match = self._best_match(vector, namespace_id)
+        duplicate = match is not None and match[1] > DEDUPE_THRESHOLD
+        slot = match[0] if duplicate else self._next_slot
+
+        self._unindex_slot(slot)
+        self._vectors[slot] = vector
+        self._namespace_ids[slot] = namespace_id
+        self._expires_at[slot] = time.monotonic() + self.ttl
+        self._values[slot] = value
+        self._index_slot(slot, vector, namespace_id)
+
+        if not duplicate:
+            self._next_slot = (slot + 1) % self.max_entries
+            self._size = min(self._size + 1, self.max_entries)
+
+    def clear(self):
+        """Remove all cached entries."""
+        self._namespace_ids.fill(-1)
+        self._expires_at.fill(0)
+        self._values = [None] * self.max_entries
+        self._namespaces.clear()
+        self._tables = [{} for _ in range(NUM_TABLES)]
+        self._slot_buckets = [None] * self.max_entries
+        self._size = 0
+        self._next_slot = 0
+
+    def _best_match(self, embedding: np.ndarray, namespace_id: int) -> Optional[Tuple[int, float]]:
+        """Slot and similarity of the closest unexpired entry in a namespace."""
+        if self._size <= EXACT_SCAN_LIMIT:
+            candidates = np.flatnonzero(self._namespace_ids[:self._size] == namespace_id)
+        else:
+            candidates = self._lsh_candidates(embedding, namespace_id)
+        if candidates.size == 0:
+            return None
+
+        candidates = candidates[self._expires_at[candidates] > time.monotonic()]
+        if candidates.size == 0:
+            return None
+
+        best, scores = topk_cosine(embedding, self._vectors[candidates], 1)
+        return int(candidates[best[0]]), float(scores[0])
+
+    def _drop_unused_namespaces(self):
+        """Forget namespaces that no longer own any slot."""
+        live_ids = set(self._namespace_ids[:self._size].tolist())
+        self._namespaces = {
+            namespace: namespace_id
+            for namespace, namespace_id in self._namespaces.items()
+            if namespace_id in live_ids
+        }
+
+    def _signatures(self, vector: np.ndarray) -> List[bytes]:
+        """Bucket signature of a vector in every LSH table."""
+        bits = (self._projections @ vector) > 0
+        return [row.tobytes() for row in np.packbits(bits, axis=1)]
+
+    def _lsh_candidates(self, embedding: np.ndarray, namespace_id: int) -> np.ndarray:
+        """Slots sharing at least one LSH bucket with the query."""
+        candidates: Set[int] = set()
+        for table, signature in zip(self._tables, self._signatures(embedding)):
+            candidates.update(table.get((namespace_id, signature), ()))
+        return np.fromiter(candidates, dtype=np.int64, count=len(candidates))
+
+    def _index_slot(self, slot: int, vector: np.ndarray, namespace_id: int):
+        """Add a slot to the LSH tables."""
+        signatures = self._signatures(vector)
+        for table, signature in zip(self._tables, signatures):
+            table.setdefault((namespace_id, signature), set()).add(slot)
+        self._slot_buckets[slot] = signatures
+
+    def _unindex_slot(self, slot: int):
+        """Remove an about-to-be-overwritten slot from the LSH tables."""
+        signatures = self._slot_buckets[slot]
+        if signatures is None:
+            return
+        namespace_id = int(self._namespace_ids[slot])
+        for table, signature in zip(self._tables, signatures):
+            key = (namespace_id, signature)
+            bucket = table.get(key)
+            if bucket is not None:
+                bucket.discard(slot)
+                if not bucket:
+                    del table[key]
+        self._slot_buckets[slot] = None
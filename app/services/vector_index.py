@@ -0,0 +1,159 @@
+"""
+Nearest-neighbour index over chunk embeddings for semantic search.
+
+Vectors are expected to be L2-normalized, so inner product is cosine similarity.
+When hnswlib is installed whole-corpus queries walk an HNSW graph; otherwise,
+and for queries restricted to a few documents, candidates are scored exactly.
+Without hnswlib the vectors are kept as float16, half the memory of float32,
+and upcast a block at a time when scored (hnswlib keeps its own float32 copy).
+"""
+
+import logging
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from app.services.scoring import topk_cosine
+
+logger = logging.getLogger(__name__)
+
+try:
+    import hnswlib
+except ImportError:
+    hnswlib = None
+
+# HNSW graph parameters
+HNSW_M = 16
+HNSW_EF_CONSTRUCTION = 200
+HNSW_EF_SEARCH = 64
+
+# Element type of the vectors held without hnswlib, and rows upcast per scoring step
+STORAGE_DTYPE = np.float16
+SCORE_BLOCK_ROWS = 4096
+
+
+class ChunkVectorIndex:
+    """Cosine-similarity index of chunk embeddings, grouped by document."""
+
+    def __init__(self, dim: int, initial_capacity: int = 1024):
+        self.dim = dim
+        self._lock = threading.Lock()
+        self._capacity = initial_capacity
+
+        # Label -> (document id, chunk position); labels are never reused
+        self._labels: List[Tuple[str, int]] = []
+        self._doc_labels: Dict[str, np.ndarray] = {}
+        self._live = np.zeros(initial_capacity, dtype=bool)
+
+        self._hnsw = None
+        self._vectors: Optional[np.ndarray] = None
+        if hnswlib is not None:
+            self._hnsw = hnswlib.Index(space="ip", dim=dim)
+            self._hnsw.init_index(max_elements=initial_capacity, ef_construction=HNSW_EF_CONSTRUCTION, M=HNSW_M)
+            self._hnsw.set_ef(HNSW_EF_SEARCH)
+        else:
+            self._vectors = np.zeros((initial_capacity, dim), dtype=STORAGE_DTYPE)
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self._doc_labels
+
+    def add_document(self, doc_id: str, vectors: np.ndarray):
+        """Index one embedding per chunk of a document, in chunk order."""
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        with self._lock:
+            if doc_id in self._doc_labels:
+                return
+            start = len(self._labels)
+            count = vectors.shape[0]
+            self._reserve(start + count)
+
+            labels = np.arange(start, start + count)
+            if self._hnsw is not None:
+                if count:
+                    self._hnsw.add_items(vectors, labels)
+            else:
+                self._vectors[start:start + count] = vectors
+            self._live[labels] = True
+            self._labels.extend((doc_id, position) for position in range(count))
+            self._doc_labels[doc_id] = labels
+
+    def remove_document(self, doc_id: str):
+        """Drop a document's chunks from future results."""
+        with self._lock:
+            labels = self._doc_labels.pop(doc_id, None)
+            if labels is None:
+                return
+            self._live[labels] = False
+            if self._hnsw is not None:
+                for label in labels.tolist():
+                    self._hnsw.mark_deleted(label)
+
+    def search(
+        self,
+        query: np.ndarray,
+        k: int,
+        document_ids: Optional[Iterable[str]] = None
+    ) -> List[Tuple[str, int, float]]:
+        """Return up to k (document id, chunk position, cosine) matches, best first."""
+        query = np.asarray(query, dtype=np.float32)
+        with self._lock:
+            if document_ids is None:
+                candidates = np.flatnonzero(self._live[:len(self._labels)])
+            else:
+                parts = [self._doc_labels[doc_id] for doc_id in document_ids if doc_id in self._doc_labels]
+                candidates = np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
+            if candidates.size == 0 or k <= 0:
+                return []
+
+            if self._hnsw is not None and document_ids is None:
+                labels, scores = self._hnsw_query(query, min(k, candidates.size))
+            else:
+                labels, scores = self._exact_query(query, candidates, k)
+            return [(*self._labels[label], score) for label, score in zip(labels, scores)]
+
+    def _hnsw_query(self, query: np.ndarray, k: int) -> Tuple[List[int], List[float]]:
+        """Approximate search over the whole graph."""
+        try:
+            labels, distances = self._hnsw.knn_query(query, k=k)
+        except RuntimeError:
+            # Too few reachable live elements for k; score them exactly instead
+            return self._exact_query(query, np.flatnonzero(self._live[:len(self._labels)]), k)
+        # hnswlib reports inner-product distance as 1 - similarity
+        return labels[0].tolist(), (1.0 - distances[0]).tolist()
+
+    def _exact_query(self, query: np.ndarray, candidates: np.ndarray, k: int) -> Tuple[List[int], List[float]]:
+        """Brute-force cosine scoring of the given labels."""
+        if self._hnsw is not None:
+            matrix = np.asarray(self._hnsw.get_items(candidates.tolist()), dtype=np.float32)
+            order, scores = topk_cosine(query, matrix, k)
+            return candidates[order].tolist(), scores.tolist()
+
+        # numpy has no float16 BLAS kernel, so rows are upcast and scored in
+        # float32 one block at a time, keeping each block's best k
+        labels: List[int] = []
+        label_scores: List[float] = []
+        for start in range(0, candidates.size, SCORE_BLOCK_ROWS):
+            block = candidates[start:start + SCORE_BLOCK_ROWS]
+            order, scores = topk_cosine(query, self._vectors[block].astype(np.float32), k)
+            labels.extend(block[order].tolist())
+            label_scores.extend(scores.tolist())
+        best = sorted(range(len(labels)), key=label_scores.__getitem__, reverse=True)[:k]
+        return [labels[i] for i in best], [label_scores[i] for i in best]
+
+    def _reserve(self, size: int):
+        """Grow storage so labels up to size fit."""
+        if size <= self._capacity:
+            return
+        capacity = max(size, self._capacity * 2)
+        if self._hnsw is not None:
+            self._hnsw.resize_index(capacity)
+        else:
+            vectors = np.zeros((capacity, self.dim), dtype=STORAGE_DTYPE)
+            vectors[:self._capacity] = self._vectors
+            self._vectors = vectors
+        live = np.zeros(capacity, dtype=bool)
+        live[:self._capacity] = self._live
+        self._live = live
+        self._capacity = capacity
+        logger.debug(f"Chunk vector index grown to {capacity} entries")
\ No newline at end of file